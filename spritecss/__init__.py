@@ -15,6 +15,8 @@ generator
   references to sprites that have been mapped.
 """
 
+from os import path
+
 class SpriteMap(list):
     def __init__(self, fname, L=[]):
         self.fname = fname
@@ -28,6 +30,16 @@ class SpriteMap(list):
             return o.fname == self.fname
         return NotImplemented
 
+class SpriteMapPage(SpriteMap):
+    """Page number *page* of the images spritemap *smap* is split into."""
+
+    def __init__(self, smap, page, L=[]):
+        (base, ext) = path.splitext(smap.fname)
+        fname = "%s-%d%s" % (base, page, ext)
+        super(SpriteMapPage, self).__init__(fname, L)
+        self.spritemap = smap
+        self.page = page
+
 class SpriteRef(object):
     """Reference to a sprite, existent or not."""
 
@@ -36,6 +36,12 @@ class CSSConfig(object):
         with open(fname, "rb") as fp:
             return cls(CSSParser.from_file(fp), fname=fname)
 
+    def _get_bool(self, key, default):
+        rv = self._data.get(key, default)
+        if isinstance(rv, basestring):
+            return rv.lower() not in ("0", "false", "no", "off")
+        return bool(rv)
+
     def normpath(self, p):
         """Normalize a possibly relative path *p* to the root."""
         return path.normpath(path.join(self.root, p))
@@ -77,14 +83,92 @@ class CSSConfig(object):
         else:
             return bool(rv)
 
+    @property
+    def deduplicate(self):
+        return self._get_bool("deduplicate", True)
+
     @property
     def padding(self):
         return self._data.get("padding", (1, 1))
 
+    @property
+    def packer(self):
+        return self._data.get("packer", "anneal")
+
     @property
     def anneal_steps(self):
         return int(self._data.get("anneal_steps", 9200))
 
+    @property
+    def anneal_patience(self):
+        if "anneal_patience" in self._data:
+            return int(self._data["anneal_patience"])
+
+    @property
+    def anneal_time_ms(self):
+        if "anneal_time_ms" in self._data:
+            return int(self._data["anneal_time_ms"])
+
+    @property
+    def anneal_time_scope(self):
+        rv = self._data.get("anneal_time_scope", "spritemap")
+        if rv not in ("spritemap", "build"):
+            raise ValueError("anneal_time_scope must be "
+                             "spritemap or build, not %r" % (rv,))
+        return rv
+
+    @property
+    def anneal_tiebreak(self):
+        return self._get_bool("anneal_tiebreak", False)
+
+    @property
+    def anneal_bin_size(self):
+        return int(self._data.get("anneal_bin_size", 0)) or None
+
+    @property
+    def jobs(self):
+        return int(self._data.get("jobs", 1))
+
+    @property
+    def seed(self):
+        if "seed" in self._data:
+            return int(self._data["seed"])
+
+    @property
+    def max_width(self):
+        if "max_width" in self._data:
+            return int(self._data["max_width"])
+
+    @property
+    def max_height(self):
+        if "max_height" in self._data:
+            return int(self._data["max_height"])
+
+    @property
+    def max_pixels(self):
+        if "max_pixels" in self._data:
+            return int(self._data["max_pixels"])
+
+    @property
+    def warm_start(self):
+        return self._get_bool("warm_start", False)
+
+    @property
+    def stable_placement(self):
+        return self._get_bool("stable_placement", False)
+
+    @property
+    def repack_threshold(self):
+        return float(self._data.get("repack_threshold", 0.5))
+
+    @property
+    def optimize_compression(self):
+        return self._get_bool("optimize_compression", False)
+
+    @property
+    def cache_dir(self):
+        return self._data.get("cache_dir")
+
     def get_spritemap_out(self, dn):
         "Get output image filename for spritemap directory *dn*."
         if "output_image" in self._data:
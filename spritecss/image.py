@@ -1,5 +1,39 @@
+import struct
+
 from . import png
 
+def probe_header(fo):
+    """Read the width, height and bit depth of the PNG image in file *fo*
+    from the chunks before its image data.
+
+    The bit depth is that of the pixels `Image.load` decodes: that of the
+    IHDR chunk, but 8 for palette images, and less if an sBIT chunk says
+    fewer bits are significant. Other chunks are skipped unread.
+    """
+    if fo.read(8) != png._signature:
+        raise png.FormatError("PNG file has invalid signature.")
+    (length, type) = struct.unpack("!I4s", fo.read(8))
+    if type != "IHDR" or length != 13:
+        raise png.FormatError("PNG file does not start with an IHDR chunk.")
+    (width, height, bitdepth, color_type) = struct.unpack("!2I2B", fo.read(10))
+    fo.seek(3 + 4, 1)
+    if color_type == 3:
+        bitdepth = 8
+    while True:
+        header = fo.read(8)
+        if len(header) != 8:
+            raise png.FormatError("This PNG file has no IDAT chunks.")
+        (length, type) = struct.unpack("!I4s", header)
+        if type == "IDAT":
+            break
+        elif type == "sBIT":
+            sbit = struct.unpack("%dB" % length, fo.read(length))
+            bitdepth = min(bitdepth, max(sbit))
+            fo.seek(4, 1)
+        else:
+            fo.seek(length + 4, 1)
+    return (width, height, bitdepth)
+
 # TODO Image class should abstract `pixels`
 # TODO Image class shouldn't assume RGBA
 class Image(object):
@@ -16,6 +50,9 @@ class Image(object):
         self.close = fo.close
         return self
 
+    def close(self):
+        pass
+
     def save(self, fo):
         kwds = self._meta.copy()
         for k in ("size", "width", "height", "bitdepth"):
@@ -30,3 +67,44 @@ class Image(object):
     @property
     def bitdepth(self):
         return self._meta["bitdepth"]
+
+class DeferredImage(Image):
+    """An image of which only the size and bit depth are read up front, from
+    the PNG header.
+
+    The file is decoded when its pixels are used. It is read whole and
+    closed right away, so no file is held open in between. Each access to
+    `pixels` decodes afresh, unless pixels have been assigned.
+    """
+
+    def __init__(self, fname, width, height, bitdepth):
+        self.fname = fname
+        self.width = width
+        self.height = height
+        self._pixels = None
+        self._meta = {"bitdepth": bitdepth}
+
+    @classmethod
+    def probe(cls, fname):
+        with open(fname, "rb") as fo:
+            (width, height, bitdepth) = probe_header(fo)
+        return cls(fname, width, height, bitdepth)
+
+    def _decode(self):
+        with open(self.fname, "rb") as fo:
+            data = fo.read()
+        (width, height, pixels, meta) = png.Reader(bytes=data).asRGBA()
+        if (width, height, meta["bitdepth"]) != self.size + (self.bitdepth,):
+            raise png.FormatError("%s changed since it was probed"
+                                  % (self.fname,))
+        return pixels
+
+    @property
+    def pixels(self):
+        if self._pixels is None:
+            return self._decode()
+        return self._pixels
+
+    @pixels.setter
+    def pixels(self, pixels):
+        self._pixels = pixels
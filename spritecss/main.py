@@ -1,16 +1,27 @@
 import sys
+import time
 import logging
 import optparse
-from os import path, access, R_OK
+from os import path, access, unlink, R_OK
 from itertools import ifilter
 from contextlib import contextmanager
 
+from spritecss import SpriteMapPage
 from spritecss.css import CSSParser, print_css
 from spritecss.config import CSSConfig
 from spritecss.finder import find_sprite_refs
 from spritecss.mapper import SpriteMapCollector, mapper_from_conf
-from spritecss.packing import PackedBoxes, print_packed_size
-from spritecss.packing.sprites import open_sprites
+from spritecss.packing import packer_from_conf, print_packed_size
+from spritecss.packing.sprites import (open_sprites, dedup_sprites,
+                                       order_fname, load_sprite_order,
+                                       save_sprite_order, order_sprites,
+                                       layout_fname, load_sprite_layout,
+                                       save_sprite_layout, pin_sprites,
+                                       alias_placements)
+from spritecss.packing.pages import PageLimits, pack_pages
+from spritecss.packing.cache import PackingCache
+from spritecss.packing.stable import place_pinned
+from spritecss.packing.compress import arrange_for_compression
 from spritecss.stitch import stitch
 from spritecss.replacer import SpriteReplacer
 
@@ -61,6 +72,44 @@ class InMemoryCSSFile(CSSFile):
     def open_parser(self):
         yield self._evs
 
+def place_stable(smap, sprites, conf, limits):
+    """Place *sprites* around their placements in the earlier layout of
+    *smap*, and return the single page that makes.
+
+    Returns None if there is no earlier layout, or the sprites should be
+    packed all over again for wasting too much space or breaking *limits*.
+    """
+    layout = load_sprite_layout(layout_fname(smap))
+    if not layout:
+        return
+    (pinned, new) = pin_sprites(sprites, layout)
+    if not pinned:
+        return
+    packed = place_pinned(pinned, new)
+    if not limits.fits(packed.size):
+        logger.debug("%s: repacking to fit size limits", smap.fname)
+    elif packed.unused_amount > conf.repack_threshold:
+        logger.debug("%s: repacking at %.1f%% empty space",
+                     smap.fname, packed.unused_amount * 100)
+    else:
+        return [packed]
+
+def remove_stale_pages(smap, num_pages):
+    """Remove images of *smap* left from an earlier build that split it into
+    a different number of pages than *num_pages*.
+    """
+    stale = []
+    if num_pages > 1:
+        stale.append(smap.fname)
+    page_no = num_pages + 1 if num_pages > 1 else 1
+    while path.exists(SpriteMapPage(smap, page_no).fname):
+        stale.append(SpriteMapPage(smap, page_no).fname)
+        page_no += 1
+    for fname in stale:
+        if path.exists(fname):
+            logger.debug("removing stale spritemap image %s", fname)
+            unlink(fname)
+
 def spritemap(css_fs, conf=None, out=sys.stderr):
     w_ln = lambda t: out.write(t + "\n")
 
@@ -75,20 +124,105 @@ def spritemap(css_fs, conf=None, out=sys.stderr):
     # Weed out single-image spritemaps (these make no sense.)
     smaps = [sm for sm in smaps if len(sm) > 1]
 
+    packer = packer_from_conf(conf)
+    limits = PageLimits.from_conf(conf)
+    cache = PackingCache.from_conf(conf)
+    # Taken from the base configuration, as a build-wide time budget gives
+    # each spritemap a different share of it from one build to the next.
+    cache_settings = [conf.packer, packer.settings_from_conf(conf)]
+
+    # A build-wide time budget is shared among the spritemaps by their number
+    # of sprites, giving time left over by one map to those after it.
+    build_budget = (conf.anneal_time_ms is not None and
+                    conf.anneal_time_scope == "build")
+    if build_budget:
+        build_deadline = time.time() + conf.anneal_time_ms / 1000.0
+        sprites_left = sum(len(sm) for sm in smaps)
+
     sm_plcs = []
     for smap in smaps:
+        map_conf = conf
+        if build_budget:
+            time_left = max(0, build_deadline - time.time())
+            map_time_ms = int(1000 * time_left * len(smap) / sprites_left)
+            sprites_left -= len(smap)
+            map_conf = CSSConfig(base=dict(conf, anneal_time_ms=map_time_ms))
+
         with open_sprites(smap, pad=conf.padding) as sprites:
             w_ln("packing sprites in mapping %s" % (smap.fname,))
-            logger.debug("annealing %s in steps of %d",
-                         smap.fname, conf.anneal_steps)
-            packed = PackedBoxes(sprites, anneal_steps=conf.anneal_steps)
-            print_packed_size(packed)
-            sm_plcs.append((smap, packed.placements))
+            aliases = []
+            if conf.deduplicate:
+                (sprites, aliases) = dedup_sprites(sprites)
+                for (sn, orig) in aliases:
+                    logger.debug("%s is identical to %s", sn.fname, orig.fname)
+                if aliases:
+                    w_ln(" - %d duplicate sprites" % (len(aliases),))
+            logger.debug("packing %s with the %s packer",
+                         smap.fname, conf.packer)
+            warm = False
+            if conf.warm_start:
+                names = load_sprite_order(order_fname(smap))
+                if names:
+                    (sprites, kept) = order_sprites(sprites, names)
+                    # Refining an order only pays off if most of it is kept.
+                    warm = 2 * kept > len(sprites)
+                if warm:
+                    logger.debug("warm start from %s", order_fname(smap))
+            # Packing a map split into pages takes several packings, which
+            # share the time budget of the map between them.
+            map_deadline = None
+            if map_conf.anneal_time_ms is not None:
+                map_deadline = time.time() + map_conf.anneal_time_ms / 1000.0
+            def pack(boxes):
+                pack_conf = map_conf
+                if map_deadline is not None:
+                    time_left = max(0, map_deadline - time.time())
+                    pack_conf = CSSConfig(base=dict(
+                        map_conf, anneal_time_ms=int(1000 * time_left)))
+                return packer.from_conf(boxes, pack_conf, warm=warm)
+            if cache:
+                pack = cache.wrap(pack, cache_settings)
+            pages = None
+            if conf.stable_placement:
+                pages = place_stable(smap, sprites, conf, limits)
+            if pages is None:
+                pages = pack_pages(sprites, pack, limits)
+                if conf.optimize_compression:
+                    pages = [arrange_for_compression(packed.placements,
+                                                     packed.size) or packed
+                             for packed in pages]
+            else:
+                w_ln(" - keeping earlier placements")
+            if len(pages) > 1:
+                w_ln("splitting %s into %d pages" % (smap.fname, len(pages)))
+            if conf.stable_placement:
+                if len(pages) == 1:
+                    save_sprite_layout(layout_fname(smap), pages[0].placements)
+                elif path.exists(layout_fname(smap)):
+                    unlink(layout_fname(smap))
+            if conf.warm_start:
+                save_sprite_order(order_fname(smap),
+                                  [sn for packed in pages
+                                   for (pos, sn) in packed.placements])
+
+            remove_stale_pages(smap, len(pages))
+            for (page_no, packed) in enumerate(pages, 1):
+                page = smap
+                if len(pages) > 1:
+                    page = SpriteMapPage(smap, page_no)
+                print_packed_size(packed)
+                # Packings that weren't annealed, as those taken from the
+                # cache, have no steps to tell of.
+                steps_used = getattr(packed, "steps_used", None)
+                if steps_used is not None:
+                    w_ln(" - %d annealing steps used" % (steps_used,))
+                plcs = packed.placements
+                sm_plcs.append((page, plcs + alias_placements(plcs, aliases)))
 
-            w_ln("writing spritemap image at %s" % (smap.fname,))
-            im = stitch(packed)
-            with open(smap.fname, "wb") as fp:
-                im.save(fp)
+                w_ln("writing spritemap image at %s" % (page.fname,))
+                im = stitch(packed)
+                with open(page.fname, "wb") as fp:
+                    im.save(fp)
 
     replacer = SpriteReplacer(sm_plcs)
     for css in css_fs:
@@ -102,6 +236,10 @@ op.add_option("-c", "--conf", metavar="INI",
               help="read base configuration from INI")
 op.add_option("--padding", type=int, metavar="N",
               help="keep N pixels of padding between sprites")
+op.add_option("--anneal-time", type=int, metavar="MS",
+              help="spend at most MS milliseconds annealing a spritemap")
+op.add_option("-j", "--jobs", type=int, metavar="N",
+              help="anneal N chains in parallel, keeping the best")
 op.add_option("-v", "--verbose", action="store_true",
               help="use debug logging level")
 #op.add_option("--in-memory", action="store_true",
@@ -136,6 +274,10 @@ def main():
         base["anneal_steps"] = opts.anneal
     if opts.padding:
         base["padding"] = (opts.padding, opts.padding)
+    if opts.anneal_time:
+        base["anneal_time_ms"] = opts.anneal_time
+    if opts.jobs:
+        base["jobs"] = opts.jobs
 
     conf = CSSConfig(base=base)
     spritemap([css_cls.open_file(fn, conf=conf) for fn in args], conf=conf)
@@ -4,11 +4,11 @@ This is a fairly dumb algorithm.
 
 The gist of it is as follows:
 
-1. Shuffle the list of all boxes
-2. Take the summed area of all boxes and create a huge container
-3. For every box, insert it into the huge container
+1. Sort the list of all boxes in the best of a few simple orders
+2. Create the smallest square container the boxes can be inserted into
+3. For every box, insert it into the container
 5. If we're satisfied with the result, return it
-5. Switch list position of two boxes, go to step 2
+5. Rearrange the list of boxes a little, go to step 3
 
 Insertion is where the action is at. This is a simple divide-and-conquer
 algorithm, as follows:
@@ -18,10 +18,19 @@ algorithm, as follows:
    space into two child rectangles
 """
 
+import math
+import time
 import random
+import multiprocessing
+from array import array
+from itertools import izip
+from collections import OrderedDict
 from .anneal import Annealer
+from .freeleaves import FreeLeaves
 
 class Rect(object):
+    __slots__ = ("x1", "y1", "x2", "y2")
+
     def __init__(self, rect=None, x1=None, y1=None, x2=None, y2=None):
         # calculate rect
         if rect:
@@ -68,111 +77,530 @@ class Rect(object):
     def from_size(cls, size):
         return cls((0, 0, size[0], size[1]))
 
+class Box(Rect):
+    """A box of a given size and padding, standing in for a sprite."""
+
+    __slots__ = ("pad_x", "pad_y")
+
+    def __init__(self, width, height, pad=(0, 0)):
+        (self.x1, self.y1, self.x2, self.y2) = (0, 0, width, height)
+        (self.pad_x, self.pad_y) = pad
+
 class NoRoom(Exception):
     pass
 
 class Node(object):
+    __slots__ = ()
+
     def insert(self, rect):
         raise NoRoom
 
 class BoxNode(Node, Rect):
+    """A node in the packing tree.
+
+    Nodes are created in great numbers while annealing, so they take their
+    coordinates positionally, have no instance dict, and the insertion code
+    works on plain coordinates rather than the `Rect` properties.
+    """
+
+    __slots__ = ("children", "rect", "box", "divided")
+
+    def __init__(self, x1, y1, x2, y2):
+        self.x1 = x1
+        self.y1 = y1
+        self.x2 = x2
+        self.y2 = y2
+
+    @classmethod
+    def from_size(cls, size):
+        return cls(0, 0, size[0], size[1])
+
     def insert(self, rect):
+        (w, h) = (rect.width, rect.height)
+        return self._insert(rect, w, h, w + rect.pad_x, h + rect.pad_y)
+
+    def _insert(self, rect, w, h, ow, oh):
         # If we've got sub-nodes, they are responsible for allocating space.
         if hasattr(self, "children"):
-            return self.insert_child(rect)
+            return self.insert_child(rect, w, h, ow, oh)
         # Otherwise we divy up and create child surfaces
         else:
-            return self.insert_divide(rect)
+            return self.insert_divide(rect, w, h, ow, oh)
 
-    def insert_divide(self, rect):
+    def insert_divide(self, rect, w, h, ow, oh):
         """Insert *rect* into self by splitting own area into suitably-sized
         children rect nodes.
+
+        *w*, *h* is the size of *rect*, and *ow*, *oh* its size with padding.
         """
+        (x1, y1, x2, y2) = (self.x1, self.y1, self.x2, self.y2)
+
         # If there's no way rect can fit inside self, return early.
-        if not self.fits(rect):
+        if x2 - x1 < ow or y2 - y1 < oh:
             raise NoRoom("rect does not fit")
 
         # If the rect is relatively wider, stack horizontally.
-        if rect.aspect > self.aspect:
+        if w * (y2 - y1) > (x2 - x1) * h:
             # +----+----+
             # | r1 | r2 |  r1 + r2 = self
             # +----+----+
-            used = BoxNode(self, x2=(self.x1 + rect.width + rect.pad_x))
-            free = BoxNode(self, x1=used.x2)
+            used = BoxNode(x1, y1, x1 + ow, y2)
+            free = BoxNode(x1 + ow, y1, x2, y2) if x1 + ow < x2 else None
         # If relatively taller, stack vertically.
         else:
-            used = BoxNode(self, y2=(self.y1 + rect.height + rect.pad_y))
-            free = BoxNode(self, y1=used.y2)
+            used = BoxNode(x1, y1, x2, y1 + oh)
+            free = BoxNode(x1, y1 + oh, x2, y2) if y1 + oh < y2 else None
 
         used.rect = rect
 
         #: opaque is the consumed area
         # it differs from used in that it includes the padding
-        opaque = OpaqueBoxNode(used, x2=(used.x1 + rect.width + rect.pad_x),
-                                     y2=(used.y1 + rect.height + rect.pad_y))
-        fragments = [opaque]
-        if opaque.y2 < used.y2: # vertical remainder
-            fragments.append(BoxNode(used, y1=opaque.y2, x2=opaque.x2))
-        if opaque.x2 < used.x2: # horizontal remainder
-            fragments.append(BoxNode(used, x1=opaque.x2, y2=opaque.y2))
-        if opaque.y2 < used.y2 and opaque.x2 < used.x2: # diagonal remainder
-            fragments.append(BoxNode(used, x1=opaque.x2, y1=opaque.y2))
-
-        used.children = tuple(f for f in fragments if f.area)
-
-        if free.area:
+        (ox2, oy2, ux2, uy2) = (x1 + ow, y1 + oh, used.x2, used.y2)
+        opaque = OpaqueBoxNode(x1, y1, ox2, oy2)
+        #: the node that was divided to make room, see `undivide`
+        opaque.divided = self
+        fragments = [opaque] if ow and oh else []
+        if ow and oy2 < uy2: # vertical remainder
+            fragments.append(BoxNode(x1, oy2, ox2, uy2))
+        if oh and ox2 < ux2: # horizontal remainder
+            fragments.append(BoxNode(ox2, y1, ux2, oy2))
+        if oy2 < uy2 and ox2 < ux2: # diagonal remainder
+            fragments.append(BoxNode(ox2, oy2, ux2, uy2))
+
+        used.children = tuple(fragments)
+
+        if free is not None:
             self.children = (used, free)
         else:
             self.children = (used,)
 
         return opaque
 
-    def insert_child(self, rect):
+    def iter_free_leaves(self):
+        """Iterate over the leaves that boxes can be inserted into, in the
+        order `insert` tries them."""
+        if hasattr(self, "children"):
+            for child in self.children:
+                for leaf in child.iter_free_leaves():
+                    yield leaf
+        else:
+            yield self
+
+    def undivide(self):
+        """Undo the insertion that divided self, making it a leaf again.
+
+        Only valid for the most recent insertion still in the tree, as later
+        insertions may have divided the children that are discarded here.
+        """
+        del self.children
+
+    def insert_child(self, rect, w, h, ow, oh):
         """Insert *rect* into the first child that can take it."""
         for child in self.children:
             try:
-                return child.insert(rect)
+                return child._insert(rect, w, h, ow, oh)
             except NoRoom:
                 continue
         else:
             raise NoRoom("couldn't fit into any child")
 
 class OpaqueBoxNode(BoxNode):
-    def insert(self, rect):
+    __slots__ = ()
+
+    def _insert(self, rect, w, h, ow, oh):
         raise NoRoom("opaque box node")
 
+    def iter_free_leaves(self):
+        return iter(())
+
+INFINITY = float("inf")
+
+def _common_prefix(a, b):
+    """Length of the longest common prefix of sequences *a* and *b*."""
+    n = 0
+    for (x, y) in izip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
 class PackingAnnealer(Annealer):
-    def __init__(self, boxes):
-        # self.move, self.energy need not be set: the class methods are fine.
+    """Anneals the insertion order of *boxes*.
+
+    The state is a list of indices into *boxes*. Inserting a box only depends
+    on the boxes inserted before it, so the packed tree is kept between energy
+    evaluations along with a record of every insertion; a new state rewinds
+    the tree to the prefix it shares with the previous one and only inserts
+    the remaining boxes.
+
+    Boxes go into the first free leaf that fits them, as with
+    `BoxNode.insert`, but the leaf is looked up in a `FreeLeaves` index
+    rather than by walking the tree.
+
+    The root is by default large enough for any state. States that don't fit
+    a smaller root, such as one set by `fit_root`, have infinite energy.
+
+    Random numbers come from a generator of the annealer's own, seeded with
+    *seed*, so that a given seed always anneals the same way.
+
+    Boxes of the same size pack the same way, so a move never just swaps two
+    of them: boxes are put in size classes, and only boxes of different
+    classes are swapped. Besides swaps, moves shift a block of boxes to
+    elsewhere in the order, or reverse a run of boxes.
+
+    For the same reason, the energies of the last *memo_size* sequences of
+    size classes can be remembered. A state met again, as happens when a
+    move and then its opposite are accepted, is then not packed at all; the
+    tree is left as packed for an earlier state. The counts of states found
+    and not found are kept in `memo_hits` and `memo_misses`. Few states are
+    met again, and making the key of one takes time by the number of boxes
+    where packing it may not, so this is off by default.
+
+    Many states pack into the same area. With *tiebreak*, the energy is the
+    area plus `square_weight` times the difference between the width and
+    height of the packing, which leads the search among such states toward
+    squarer packings. The best state is still the one of least area, and
+    only among those the squarest; see `best_key`.
+    """
+
+    #: energy added per unit of difference between width and height, with
+    #: tiebreak
+    square_weight = 10
+
+    #: relative odds of a swap, a block shift and a reversal
+    move_odds = (6, 2, 2)
+
+    def __init__(self, boxes, root_size=None, seed=None, memo_size=0,
+                 tiebreak=False):
+        # self.move, self.energy, self.undo need not be set: the class
+        # methods are fine.
+        self.rng = random.Random(seed)
+        self.tiebreak = tiebreak
+        self.memo_size = memo_size
+        self.memo_hits = self.memo_misses = 0
         self.boxes = boxes
         self.optimal_size = sum(b.outer_area for b in boxes)
         self.max_size = (sum(b.outer_width for b in boxes),
                          sum(b.outer_height for b in boxes))
+        self._geoms = [(b.width, b.height, b.outer_width, b.outer_height)
+                       for b in boxes]
+        classes = {}
+        self._classes = [classes.setdefault(geom, len(classes))
+                         for geom in self._geoms]
+        self.size_classes = len(classes)
+        #: box indices sorted by class, and where each class starts in it
+        self._by_class = sorted(xrange(len(boxes)),
+                                key=self._classes.__getitem__)
+        self._class_start = [0] * len(classes)
+        self._class_len = [0] * len(classes)
+        for (pos, idx) in enumerate(self._by_class):
+            cls = self._classes[idx]
+            if not self._class_len[cls]:
+                self._class_start[cls] = pos
+            self._class_len[cls] += 1
+        self.reset(root_size or self.max_size)
+
+    def reset(self, root_size):
+        """Empty the packing, starting over with a root of *root_size*."""
+        self.root_size = root_size
+        self.tree = BoxNode.from_size(root_size)
+        self.free = FreeLeaves([self.tree])
+        #: list of (node, size, pos, count) for each insertion made into the
+        #: tree, where size is the bounding size of the packing up to and
+        #: including it, and count the number of free leaves that replaced
+        #: the one at pos in the index
+        self._packed = []
+        self._order = []
+        self._memo = OrderedDict()
+
+    def fit_root(self, state, deadline=None):
+        """Bound the root to the smallest square that *state* packs into,
+        though no narrower or lower than the widest and tallest box.
+
+        A huge root lets the first splits cut it into long, thin regions; a
+        root about the size of the packing splits into more useful ones.
+
+        The side of the square starts at the square root of the summed area
+        of the boxes and doubles until the boxes fit, and is then narrowed
+        down by binary search. Boxes that fit a square need not fit every
+        larger one, but the side found is always one they fit. Once
+        time.time() reaches *deadline*, the search settles for the least
+        side found to fit so far.
+        """
+        max_w = max(geom[2] for geom in self._geoms)
+        max_h = max(geom[3] for geom in self._geoms)
+        def fits(side):
+            self.reset((max(side, max_w), max(side, max_h)))
+            return self.energy(state) < INFINITY
+        lo = hi = max(1, int(math.sqrt(self.optimal_size)))
+        while not fits(hi):
+            (lo, hi) = (hi + 1, hi * 2)
+        while lo < hi:
+            if deadline is not None and time.time() >= deadline:
+                break
+            mid = (lo + hi) // 2
+            if fits(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        self.reset((max(hi, max_w), max(hi, max_h)))
+        return self.root_size
+
+    #: keys of box geometry to sort by in `first_fit_state`, each used both
+    #: ascending and descending
+    first_fit_keys = {
+        "height": lambda (w, h, ow, oh): oh,
+        "width": lambda (w, h, ow, oh): ow,
+        "max side": lambda (w, h, ow, oh): max(ow, oh),
+        "perimeter": lambda (w, h, ow, oh): ow + oh,
+        "area": lambda (w, h, ow, oh): ow * oh,
+    }
+
+    def first_fit_state(self, deadline=None):
+        """Find the best, by `best_key`, of the states that sort the boxes by
+        each of `first_fit_keys`, bounding the root to fit it as `fit_root`
+        does.
+        No more states are tried once time.time() reaches *deadline*.
+
+        Returns the state and its energy. Ties go to the first state found,
+        and sorting is stable, so boxes otherwise keep the order given.
+        """
+        geoms = self._geoms
+        best = None
+        sorts = [(key, reverse)
+                 for (name, key) in sorted(self.first_fit_keys.iteritems())
+                 for reverse in (True, False)]
+        for (key, reverse) in sorts:
+            state = sorted(range(len(geoms)), reverse=reverse,
+                           key=lambda idx: key(geoms[idx]))
+            root_size = self.fit_root(state, deadline=deadline)
+            e = self.energy(state)
+            rank = self.best_key(state, e)
+            if best is None or rank < best[0]:
+                best = (rank, e, state, root_size)
+            if deadline is not None and time.time() >= deadline:
+                break
+        (rank, e, state, root_size) = best
+        self.reset(root_size)
+        return (state, e)
+
+    def best_state(self, state=None, e=INFINITY, deadline=None):
+        """Search all states for the best one by `best_key`, given *state*
+        with energy *e* to beat.
+
+        Boxes only ever widen and heighten a packing, so an order starting
+        with a prefix can do no better than the size of the prefix packing
+        widened and heightened to fit the boxes left, or than the summed area
+        of all boxes. Prefixes that can't beat the best state found are not
+        followed. Neither are boxes of a
+        size already tried at a position. The search ends early when the
+        lower bound is reached, or once time.time() reaches *deadline*. This
+        takes time factorial in the number of boxes; it is meant for a
+        handful of them.
+
+        Returns the best state and its energy.
+        """
+        (classes, geoms) = (self._classes, self._geoms)
+        stop_key = self.key_bound(self.lower_bound)
+        best = [self._rank(INFINITY, None), e, state]
+        if state is not None:
+            best[0] = self.best_key(state, self.energy(state))
+        def search(prefix, left):
+            if deadline is not None and time.time() >= deadline:
+                return
+            e = self._pack_state(prefix)
+            if not left or e == INFINITY:
+                key = self._rank(e, self.size)
+                if key < best[0]:
+                    best[:] = [key, e, list(prefix)]
+                return
+            (w, h) = self.size
+            w = max([w] + [geoms[idx][2] for idx in left])
+            h = max([h] + [geoms[idx][3] for idx in left])
+            bound = max(w * h, self.optimal_size)
+            if ((bound, 0) if self.tiebreak else bound) >= best[0]:
+                return
+            tried = set()
+            for idx in left:
+                if classes[idx] in tried:
+                    continue
+                tried.add(classes[idx])
+                prefix.append(idx)
+                search(prefix, [i for i in left if i != idx])
+                prefix.pop()
+                if best[0] <= stop_key:
+                    return
+        search([], range(len(self.boxes)))
+        (key, e, state) = best
+        return (state, e)
+
+    @property
+    def lower_bound(self):
+        """The least energy any state could have: the packing can be neither
+        smaller than the summed area of the boxes, nor narrower or lower than
+        the widest and tallest box.
+        """
+        max_w = max(b.outer_width for b in self.boxes)
+        max_h = max(b.outer_height for b in self.boxes)
+        return max(self.optimal_size, max_w * max_h)
 
     def move(self, state):
-        a, b = random.sample(xrange(len(state)), 2)
+        (swap, shift, reverse) = self.move_odds
+        r = self.rng.random() * (swap + shift + reverse)
+        if r < swap:
+            return self._move_swap(state)
+        elif r < swap + shift:
+            return self._move_shift(state)
+        else:
+            return self._move_reverse(state)
+
+    def _move_swap(self, state):
+        rng = self.rng
+        if self.size_classes == 1:
+            a, b = rng.sample(xrange(len(state)), 2)
+        else:
+            # Pick any box not of the class of the box at a, then find it.
+            a = rng.randrange(len(state))
+            cls = self._classes[state[a]]
+            r = rng.randrange(len(state) - self._class_len[cls])
+            if r >= self._class_start[cls]:
+                r += self._class_len[cls]
+            b = state.index(self._by_class[r])
         state[a], state[b] = state[b], state[a]
+        return ("swap", a, b)
+
+    def _move_shift(self, state):
+        n = len(state)
+        k = self.rng.randint(1, max(1, min(n // 4, n - 1)))
+        i = self.rng.randint(0, n - k)
+        j = self.rng.randint(0, n - k - 1)
+        if j >= i:
+            j += 1
+        block = state[i:i + k]
+        del state[i:i + k]
+        state[j:j] = block
+        return ("shift", i, j, k)
+
+    def _move_reverse(self, state):
+        i = self.rng.randint(0, len(state) - 2)
+        j = self.rng.randint(i + 2, len(state))
+        state[i:j] = state[i:j][::-1]
+        return ("reverse", i, j)
+
+    def undo(self, state, change):
+        kind = change[0]
+        if kind == "swap":
+            (kind, a, b) = change
+            state[a], state[b] = state[b], state[a]
+        elif kind == "shift":
+            (kind, i, j, k) = change
+            block = state[j:j + k]
+            del state[j:j + k]
+            state[i:i] = block
+        elif kind == "reverse":
+            (kind, i, j) = change
+            state[i:j] = state[i:j][::-1]
+        else:
+            raise ValueError("unknown move %r" % (change,))
 
     def energy(self, state):
-        placements = self._last_plcs = []
-        w = h = 0
-        # TODO Don't require arbitrarily sized box node for root
-        tree = BoxNode.from_size(self.max_size)
-        for idx in state:
-            box = self.boxes[idx]
-            node = tree.insert(box)
+        if not self.memo_size:
+            e = self._pack_state(state)
+            self._energy_size = self.size
+            return e
+        key = array("i", map(self._classes.__getitem__, state)).tostring()
+        memo = self._memo
+        found = memo.pop(key, None)
+        if found is None:
+            self.memo_misses += 1
+            found = (self._pack_state(state), self.size)
+            if len(memo) >= self.memo_size:
+                memo.popitem(last=False)
+        else:
+            self.memo_hits += 1
+        memo[key] = found
+        (e, self._energy_size) = found
+        return e
+
+    def best_key(self, state, e):
+        """With tiebreak, rank states by area and only then by how far from
+        square the packing is, rather than by the energy weighing the two.
+
+        Only meant for the state of the last call to `energy`.
+        """
+        return self._rank(e, self._energy_size)
+
+    def _rank(self, e, size):
+        if not self.tiebreak:
+            return e
+        if e == INFINITY:
+            return (INFINITY, 0)
+        (w, h) = size
+        return (w * h, abs(w - h))
+
+    def key_bound(self, area):
+        """The greatest `best_key` of a packing of at most *area*."""
+        return (area, INFINITY) if self.tiebreak else area
+
+    def _pack_state(self, state):
+        """Pack the boxes in the order of *state* into the tree and return
+        the energy of it.
+        """
+        keep = _common_prefix(state, self._order)
+        self._rewind(keep)
+        (w, h) = self.size
+        (boxes, geoms, free) = (self.boxes, self._geoms, self.free)
+        for idx in state[keep:]:
+            box = boxes[idx]
+            (bw, bh, ow, oh) = geoms[idx]
+            found = free.find(ow, oh)
+            if found is None:
+                # Keep track of what is in the tree for the next state.
+                self._order = state[:len(self._packed)]
+                return INFINITY
+            (pos, leaf) = found
+            node = leaf.insert_divide(box, bw, bh, ow, oh)
             node.box = box
-            placements.append((node.position, box))
+            leaves = list(leaf.iter_free_leaves())
+            free.replace(pos, 1, leaves)
             w = max(w, node.x2)
             h = max(h, node.y2)
-        self._last_size = (w, h)
-        self._last_tree = tree
+            self._packed.append((node, (w, h), pos, len(leaves)))
+        self._order = list(state)
+        if self.tiebreak:
+            return w * h + self.square_weight * abs(w - h)
         return w * h
 
+    def _rewind(self, n):
+        """Undo insertions until only the first *n* remain in the tree."""
+        packed = self._packed
+        while len(packed) > n:
+            (node, size, pos, count) = packed.pop()
+            self.free.replace(pos, count, [node.divided])
+            node.divided.undivide()
+
+    @property
+    def size(self):
+        return self._packed[-1][1] if self._packed else (0, 0)
+
+    @property
+    def placements(self):
+        return [(entry[0].position, entry[0].box) for entry in self._packed]
+
     def anneal(self, *a, **k):
         state, e = Annealer.anneal(self, range(len(self.boxes)), *a, **k)
+        # The last state evaluated need not be the best one, so repack it.
+        return self.pack(state)
+
+    def pack(self, state):
+        """Pack boxes in the order of *state* and crop the tree to fit.
+
+        Returns the placements and size of the packing.
+        """
+        if self._pack_state(state) == INFINITY:
+            raise NoRoom("boxes do not fit root of %dx%d" % self.root_size)
         # Crops nodes to fit entire map exactly
-        w, h = self._last_size
+        w, h = self.size
         def walk(n):
             n.x2 = min(n.x2, w)
             n.y2 = min(n.y2, h)
@@ -180,26 +608,126 @@ class PackingAnnealer(Annealer):
                 n.children = tuple(walk(c) for c in n.children
                                    if c.x1 < w and c.y1 < h)
             return n
-        walk(self._last_tree)
-        return self._last_plcs, self._last_size
-
-class PackedBoxes(object):
-    def __init__(self, boxes, pad=(0, 0), anneal_steps=9200):
+        walk(self.tree)
+        return self.placements, self.size
+
+def _box_geometry(box):
+    return (box.width, box.height, box.pad_x, box.pad_y)
+
+def _geometry_box(geom):
+    (w, h, pad_x, pad_y) = geom
+    return Box(w, h, pad=(pad_x, pad_y))
+
+def _anneal_chain(args):
+    """Run one annealing chain on box geometries, as done by worker processes.
+
+    Only geometries and index orders cross the process boundary, never the
+    sprite nodes themselves. Returns the best energy and state found, and the
+    number of steps taken.
+    """
+    (geoms, root_size, seed, tiebreak, schedule) = args
+    p = PackingAnnealer(map(_geometry_box, geoms), root_size=root_size,
+                        seed=seed, tiebreak=tiebreak)
+    (state, e) = Annealer.anneal(p, range(len(geoms)), **schedule)
+    key = p.best_key(state, p.energy(state))
+    return (key, state, p.steps_used)
+
+def anneal_parallel(boxes, jobs, schedule, root_size=None, seed=None,
+                    tiebreak=False):
+    """Anneal *jobs* independently seeded chains in a process pool.
+
+    *schedule* is a dict of keyword arguments for `Annealer.anneal`. The seed
+    of each chain is drawn from *seed*, so a given seed gives the same result
+    however the chains are scheduled. Returns the best state found by any
+    chain and the number of steps it took.
+    """
+    geoms = map(_box_geometry, boxes)
+    rng = random.Random(seed)
+    chains = [(geoms, root_size, rng.getrandbits(32), tiebreak, schedule)
+              for i in xrange(jobs)]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        results = pool.map(_anneal_chain, chains)
+    finally:
+        pool.terminate()
+    (key, state, steps_used) = min(results)
+    return (state, steps_used)
+
+def _pack_bin(args):
+    """Pack one bin of box geometries, as done by worker processes.
+
+    Returns the placements as (position, index into the geometries) and the
+    size of the packing.
+    """
+    (geoms, kwds) = args
+    boxes = map(_geometry_box, geoms)
+    index = dict((id(box), idx) for (idx, box) in enumerate(boxes))
+    packed = PackedBoxes(boxes, **kwds)
+    return ([(pos, index[id(box)]) for (pos, box) in packed.placements],
+            packed.size)
+
+def cluster_boxes(boxes, bin_size):
+    """Split *boxes* into bins of at most *bin_size* boxes of about the same
+    size: boxes are sorted by height, then width, and cut into bins of
+    equal count.
+    """
+    boxes = sorted(boxes, key=lambda b: (b.outer_height, b.outer_width),
+                   reverse=True)
+    n = len(boxes)
+    num_bins = -(-n // bin_size)
+    return [boxes[n * i // num_bins:n * (i + 1) // num_bins]
+            for i in xrange(num_bins)]
+
+#: packer name => packed boxes class, see `packer_from_conf`
+packers = {}
+
+def register_packer(name):
+    """Class decorator registering a packed boxes class as packer *name*."""
+    def deco(cls):
+        packers[name] = cls
+        return cls
+    return deco
+
+def packer_from_conf(conf):
+    try:
+        return packers[conf.packer]
+    except KeyError:
+        raise ValueError("unknown packer %r (choose from %s)"
+                         % (conf.packer, ", ".join(sorted(packers))))
+
+class BasePackedBoxes(object):
+    """Packs *boxes* on construction.
+
+    Every packer leaves `placements`, a list of (position, box), and the
+    bounding `size` of the packing. Packers that lay out boxes in a `BoxNode`
+    tree also leave it as `tree`; for the others it is None.
+    """
+
+    tree = None
+
+    def __init__(self, boxes, pad=(0, 0)):
         self.pad = pad
-        self.anneal_steps = anneal_steps
-        self._anneal(boxes)
-        self.__iter__ = self.placements.__iter__
-
-    def _anneal(self, boxes):
         boxes = list(boxes)
-        # TODO Find out whether sorting by box area is really a smart move.
-        boxes.sort(key=lambda b: b.area)
-        p = PackingAnnealer(boxes)
-        (plcs, size) = p.anneal(800000, 1100, self.anneal_steps, 20)
         self.optimal_area = int(sum(b.outer_area for b in boxes))
-        self.placements = plcs
-        self.size = size
-        self.tree = p._last_tree
+        self._pack(boxes)
+        self.__iter__ = self.placements.__iter__
+
+    @classmethod
+    def from_conf(cls, boxes, conf, warm=False):
+        """Pack *boxes* as configured by *conf*.
+
+        With *warm*, *boxes* are in the order of an earlier packing, which
+        packers that can make use of it refine rather than start over.
+        """
+        return cls(boxes)
+
+    @classmethod
+    def settings_from_conf(cls, conf):
+        """The settings in *conf* that change how boxes are packed."""
+        return []
+
+    def _pack(self, boxes):
+        raise NotImplementedError
 
     @property
     def area(self):
@@ -213,6 +741,159 @@ class PackedBoxes(object):
     def unused_amount(self):
         return float(self.unused_area) / self.area
 
+class PlacedBoxes(BasePackedBoxes):
+    """Boxes that have already been placed, given as (position, box)."""
+
+    def __init__(self, placements, pad=(0, 0)):
+        self.placements = list(placements)
+        boxes = [box for (pos, box) in self.placements]
+        super(PlacedBoxes, self).__init__(boxes, pad=pad)
+
+    def _pack(self, boxes):
+        self.size = (max(x + b.outer_width for ((x, y), b) in self.placements),
+                     max(y + b.outer_height for ((x, y), b) in self.placements))
+
+@register_packer("anneal")
+class PackedBoxes(BasePackedBoxes):
+    #: Schedule of a warm start, cool enough to keep most of the order.
+    warm_Tmax = 1500
+    warm_steps_divisor = 8
+    #: How much more than the least possible energy the best sorted order
+    #: may have to be used without annealing.
+    first_fit_tolerance = 0.02
+    #: Up to this many boxes, the best order is searched for rather than
+    #: annealed.
+    exact_max_boxes = 8
+
+    def __init__(self, boxes, pad=(0, 0), anneal_steps=9200,
+                 anneal_patience=None, anneal_time_ms=None, jobs=1,
+                 warm=False, seed=None, bin_size=None, tiebreak=False):
+        self.tiebreak = tiebreak
+        self.bin_size = bin_size
+        self.warm = warm
+        self.seed = seed
+        self.anneal_steps = anneal_steps
+        self.anneal_patience = anneal_patience
+        self.anneal_time_ms = anneal_time_ms
+        self.jobs = jobs
+        super(PackedBoxes, self).__init__(boxes, pad=pad)
+
+    @classmethod
+    def from_conf(cls, boxes, conf, warm=False):
+        return cls(boxes, anneal_steps=conf.anneal_steps,
+                   anneal_patience=conf.anneal_patience,
+                   anneal_time_ms=conf.anneal_time_ms, jobs=conf.jobs,
+                   warm=warm, seed=conf.seed, bin_size=conf.anneal_bin_size,
+                   tiebreak=conf.anneal_tiebreak)
+
+    @classmethod
+    def settings_from_conf(cls, conf):
+        return [conf.anneal_steps, conf.anneal_patience,
+                conf.anneal_time_ms, conf.jobs, conf.seed,
+                conf.anneal_bin_size, conf.anneal_tiebreak]
+
+    def _pack(self, boxes):
+        if self.bin_size and len(boxes) > self.bin_size:
+            self._pack_hierarchical(boxes)
+            return
+        # The time budget covers finding the order to start from as well.
+        deadline = None
+        if self.anneal_time_ms is not None:
+            deadline = time.time() + self.anneal_time_ms / 1000.0
+        schedule = dict(Tmax=800000, Tmin=1100, steps=self.anneal_steps)
+        p = PackingAnnealer(boxes, seed=self.seed, tiebreak=self.tiebreak)
+        if self.warm:
+            # An earlier order is close to good already; only refine it.
+            schedule.update(Tmax=self.warm_Tmax,
+                            steps=self.anneal_steps // self.warm_steps_divisor)
+            p.fit_root(range(len(boxes)), deadline=deadline)
+        else:
+            # Start from the best of a few sorted orders, or settle for it
+            # should it come close enough to the least energy possible.
+            (state, e) = p.first_fit_state(deadline=deadline)
+            if len(boxes) <= self.exact_max_boxes:
+                (state, e) = p.best_state(state, e, deadline=deadline)
+                schedule["steps"] = 0
+            boxes[:] = [boxes[idx] for idx in state]
+            p = PackingAnnealer(boxes, root_size=p.root_size, seed=self.seed,
+                                tiebreak=self.tiebreak)
+            if e <= p.lower_bound * (1 + self.first_fit_tolerance):
+                schedule["steps"] = 0
+        schedule.update(Emin=p.key_bound(p.lower_bound),
+                        patience=self.anneal_patience)
+        if p.size_classes == 1:
+            # Boxes all of one size pack the same in any order.
+            schedule["steps"] = 0
+        if deadline is not None and schedule["steps"]:
+            # Cool down over as many steps as the time left allows, and cut
+            # the anneal short should the estimate be off.
+            schedule["deadline"] = deadline
+            time_left = deadline - time.time()
+            steps = 0
+            if time_left > 0:
+                step_time = p.step_time(range(len(boxes)),
+                                        limit=time_left / 10)
+                steps = int(max(0, deadline - time.time()) / step_time)
+            schedule["steps"] = min(schedule["steps"], steps)
+        if not schedule["steps"]:
+            (plcs, size) = p.pack(range(len(boxes)))
+            self.steps_used = 0
+        elif self.jobs > 1:
+            (state, self.steps_used) = anneal_parallel(
+                boxes, self.jobs, schedule, root_size=p.root_size,
+                seed=self.seed, tiebreak=self.tiebreak)
+            (plcs, size) = p.pack(state)
+        else:
+            (plcs, size) = p.anneal(updates=20, **schedule)
+            self.steps_used = p.steps_used
+        self.placements = plcs
+        self.size = size
+        self.tree = p.tree
+
+    def _pack_hierarchical(self, boxes):
+        """Pack boxes too many to anneal at once in bins of boxes of about
+        the same size, and then pack the bins as boxes of their own.
+
+        Bins are packed in parallel by *jobs* processes, each with an even
+        share of any time budget; the packing of the bins gets a tenth of
+        it. Placements within bins are then offset by where the bins went.
+        """
+        bins = cluster_boxes(boxes, self.bin_size)
+        rng = random.Random(self.seed)
+        draw_seed = lambda: (None if self.seed is None
+                             else rng.getrandbits(32))
+        kwds = dict(anneal_steps=self.anneal_steps,
+                    anneal_patience=self.anneal_patience,
+                    tiebreak=self.tiebreak)
+        if self.anneal_time_ms is not None:
+            rounds = -(-len(bins) // self.jobs)
+            kwds["anneal_time_ms"] = self.anneal_time_ms * 9 // 10 // rounds
+        args = [(map(_box_geometry, bin),
+                 dict(kwds, seed=draw_seed()))
+                for bin in bins]
+        if self.jobs > 1:
+            pool = multiprocessing.Pool(self.jobs)
+            try:
+                results = pool.map(_pack_bin, args)
+            finally:
+                pool.terminate()
+        else:
+            results = map(_pack_bin, args)
+
+        bin_boxes = [Box(*size) for (plcs, size) in results]
+        if self.anneal_time_ms is not None:
+            kwds["anneal_time_ms"] = self.anneal_time_ms // 10
+        top = PackedBoxes(bin_boxes, jobs=self.jobs, seed=draw_seed(),
+                          bin_size=self.bin_size, **kwds)
+        bin_pos = dict((id(box), pos) for (pos, box) in top.placements)
+        self.placements = []
+        for (bin, bin_box, (plcs, size)) in izip(bins, bin_boxes, results):
+            (x0, y0) = bin_pos[id(bin_box)]
+            self.placements.extend(((x0 + x, y0 + y), bin[idx])
+                                   for ((x, y), idx) in plcs)
+        self.size = top.size
+        self.steps_used = top.steps_used
+
 def print_packed_size(packed, out=None):
     args = (packed.size + (packed.unused_amount * 100,))
     print >>out, "Packed size is %dx%d (%.3f%% empty space)" % args
@@ -221,3 +902,6 @@ def dump_placements(packed, out=None):
     for (pos, box) in packed.placements:
         box_desc = ",".join(map(str, box.calc_box(pos)))
         print >>out, "{0},{1}".format(box.fname, box_desc)
+
+# Register the bundled packers besides the annealer.
+from . import maxrects
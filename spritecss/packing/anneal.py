@@ -31,7 +31,8 @@ cities in the United States.
 # 
 # 2) Define a function to calculate the energy of a state.
 # 
-# 3) Define a function to make a random change to a state.
+# 3) Define a function to make a random change to a state, returning a token
+# that describes the change, and a function to undo a change given its token.
 # 
 # 4) Choose a maximum temperature, minimum temperature, and number of steps.
 # 
@@ -65,12 +66,23 @@ class Annealer:
     """
 
     out = sys.stderr
+    rng = random  # source of random numbers, such as a random.Random
 
-    def __init__(self, energy, move):
+    def __init__(self, energy, move, undo, rng=None):
         self.energy = energy  # function to calculate energy of a state
         self.move = move      # function to make a random change to a state
-
-    def anneal(self, state, Tmax, Tmin, steps, updates=0):
+        self.undo = undo      # function to revert a change made by move
+        if rng is not None:
+            self.rng = rng
+
+    def best_key(self, state, E):
+        """Key by which *state*, of energy *E*, is ranked against the best
+        state found so far; the least key wins. By default, the energy.
+        """
+        return E
+
+    def anneal(self, state, Tmax, Tmin, steps, updates=0,
+               Emin=None, patience=None, deadline=None):
         """Minimizes the energy of a system by simulated annealing.
 
         Keyword arguments:
@@ -79,6 +91,13 @@ class Annealer:
         Tmin -- minimum temperature (must be greater than zero)
         steps -- the number of steps requested
         updates -- the number of updates to print during annealing
+        Emin -- stop early once a state with at most this key is found
+        patience -- stop early after this many steps without a new best state
+        deadline -- stop early once time.time() reaches this
+
+        Moves are made on *state* in place and undone when rejected; the best
+        state found, by `best_key`, of all states tried is kept as a copy. The number of steps actually taken is
+        left in self.steps_used.
 
         Returns the best state and energy found."""
 
@@ -126,10 +145,11 @@ class Annealer:
         # Note initial state
         T = Tmax
         E = self.energy(state)
-        prevState = copy.deepcopy(state)
         prevEnergy = E
         bestState = copy.deepcopy(state)
         bestEnergy = E
+        bestKey = self.best_key(state, E)
+        bestStep = 0
         trials, accepts, improves = 0, 0, 0
         if updates > 0:
             updateWavelength = float(steps) / updates
@@ -137,34 +157,63 @@ class Annealer:
 
         # Attempt moves to new states
         while step < steps:
+            if Emin is not None and bestKey <= Emin:
+                break
+            if patience and step - bestStep >= patience:
+                break
+            if deadline is not None and time.time() >= deadline:
+                break
             step += 1
             T = Tmax * math.exp( Tfactor * step / steps )
-            self.move(state)
+            change = self.move(state)
             E = self.energy(state)
             dE = E - prevEnergy
             trials += 1
-            if dE > 0.0 and math.exp(-dE/T) < random.random():
+            key = self.best_key(state, E)
+            if key < bestKey:
+                bestState = copy.deepcopy(state)
+                bestEnergy = E
+                bestKey = key
+                bestStep = step
+            if dE > 0.0 and math.exp(-dE/T) < self.rng.random():
                 # Restore previous state
-                state = copy.deepcopy(prevState)
+                self.undo(state, change)
                 E = prevEnergy
             else:
                 # Accept new state and compare to best state
                 accepts += 1
                 if dE < 0.0:
                     improves += 1
-                prevState = copy.deepcopy(state)
                 prevEnergy = E
-                if E < bestEnergy:
-                    bestState = copy.deepcopy(state)
-                    bestEnergy = E
             if updates > 1:
                 if step // updateWavelength > (step-1) // updateWavelength:
                     update(T, E, float(accepts)/trials, float(improves)/trials)
                     trials, accepts, improves = 0, 0, 0
 
+        self.steps_used = step
+        if updates > 0 and step < steps:
+            wln('Stopped after %i of %i steps at energy %.2f' %
+                (step, steps, bestEnergy))
+
         # Return best state and energy
         return bestState, bestEnergy
 
+    def step_time(self, state, trials=20, limit=None):
+        """Estimates the time in seconds one annealing step takes by timing a
+        few moves on *state*, which are undone again.  Timing stops early
+        once it has taken *limit* seconds."""
+        start = time.time()
+        self.energy(state)
+        trial = 1
+        while trial <= trials:
+            change = self.move(state)
+            self.energy(state)
+            self.undo(state, change)
+            trial += 1
+            if limit is not None and time.time() - start >= limit:
+                break
+        return (time.time() - start) / trial
+
     def auto(self, state, minutes, steps=2000):
         """Minimizes the energy of a system by simulated annealing with
         automatic selection of the temperature schedule.
@@ -182,21 +231,19 @@ class Annealer:
             """Anneals a system at constant temperature and returns the state,
             energy, rate of acceptance, and rate of improvement."""
             E = self.energy(state)
-            prevState = copy.deepcopy(state)
             prevEnergy = E
             accepts, improves = 0, 0
             for step in range(steps):
-                self.move(state)
+                change = self.move(state)
                 E = self.energy(state)
                 dE = E - prevEnergy
-                if dE > 0.0 and math.exp(-dE/T) < random.random():
-                    state = copy.deepcopy(prevState)
+                if dE > 0.0 and math.exp(-dE/T) < self.rng.random():
+                    self.undo(state, change)
                     E = prevEnergy
                 else:
                     accepts += 1
                     if dE < 0.0:
                         improves += 1
-                    prevState = copy.deepcopy(state)
                     prevEnergy = E
             return state, E, float(accepts)/steps, float(improves)/steps
 
@@ -281,6 +328,12 @@ if __name__ == '__main__':
         a = random.randint( 0, len(state)-1 )
         b = random.randint( 0, len(state)-1 )
         state[a], state[b] = state[b], state[a]
+        return a, b
+
+    def route_undo(state, change):
+        """Swaps the two cities back."""
+        a, b = change
+        state[a], state[b] = state[b], state[a]
 
     def route_energy(state):
         """Calculates the length of the route."""
@@ -295,7 +348,7 @@ if __name__ == '__main__':
 
     # Minimize the distance to be traveled by simulated annealing with a
     # manually chosen temperature schedule
-    annealer = Annealer(route_energy, route_move)
+    annealer = Annealer(route_energy, route_move, route_undo)
     state, e = annealer.anneal(state, 10000000, 0.01, 18000*len(state), 9)
     while state[0] != 'New York City':
         state = state[1:] + state[:1]  # rotate NYC to start
@@ -0,0 +1,98 @@
+"""On-disk cache of packing results
+
+Where boxes end up depends only on their sizes and padding, and on the packer
+and its settings, never on their pixels. Results are therefore stored under a
+hash of those, so a spritemap whose sprites only changed color can skip
+packing altogether.
+
+A result is stored as the geometry and position of every box, in the order
+the packer placed them. Boxes of the same geometry are interchangeable, so a
+hit hands out the positions among such boxes in the order they are given.
+"""
+
+import os
+import json
+import errno
+import hashlib
+import logging
+import tempfile
+
+from . import PlacedBoxes, _box_geometry
+
+logger = logging.getLogger(__name__)
+
+class PackingCache(object):
+    def __init__(self, dirname):
+        self.dirname = dirname
+
+    @classmethod
+    def from_conf(cls, conf):
+        if conf.cache_dir:
+            return cls(conf.cache_dir)
+
+    def _fname(self, boxes, settings):
+        geoms = sorted(_box_geometry(box) for box in boxes)
+        key = json.dumps([geoms, settings])
+        return os.path.join(self.dirname,
+                            hashlib.sha1(key).hexdigest() + ".json")
+
+    def get(self, boxes, settings):
+        """Look up the packing of *boxes* made with *settings*.
+
+        Returns the placed boxes, or None if there is no such packing.
+        """
+        fname = self._fname(boxes, settings)
+        try:
+            with open(fname, "rb") as fp:
+                entries = json.load(fp)["placements"]
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("%s: %s", fname, e)
+            return
+        except (ValueError, KeyError) as e:
+            logger.warning("%s: invalid cache entry: %s", fname, e)
+            return
+
+        by_geom = {}
+        for box in boxes:
+            by_geom.setdefault(_box_geometry(box), []).append(box)
+        for same in by_geom.itervalues():
+            same.reverse()
+
+        plcs = []
+        for (x, y, w, h, pad_x, pad_y) in entries:
+            same = by_geom.get((w, h, pad_x, pad_y))
+            if not same:
+                logger.warning("%s: cache entry does not match", fname)
+                return
+            plcs.append(((x, y), same.pop()))
+        logger.debug("%s: packing cache hit", fname)
+        return PlacedBoxes(plcs)
+
+    def put(self, packed, settings):
+        """Store the placements of *packed*, made with *settings*."""
+        boxes = [box for (pos, box) in packed.placements]
+        fname = self._fname(boxes, settings)
+        entries = [list(pos + _box_geometry(box))
+                   for (pos, box) in packed.placements]
+        try:
+            os.makedirs(self.dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file first so readers never see half of it.
+        (fd, tmp_fname) = tempfile.mkstemp(dir=self.dirname)
+        with os.fdopen(fd, "wb") as fp:
+            json.dump({"placements": entries}, fp)
+        os.rename(tmp_fname, fname)
+
+    def wrap(self, pack, settings):
+        """Wrap the function *pack* so that it goes through the cache."""
+        def cached_pack(boxes):
+            boxes = list(boxes)
+            packed = self.get(boxes, settings)
+            if packed is None:
+                packed = pack(boxes)
+                self.put(packed, settings)
+            return packed
+        return cached_pack
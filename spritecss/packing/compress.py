@@ -0,0 +1,125 @@
+"""Arranging packed sprites so the spritemap compresses better
+
+PNG compresses the scanlines of an image one after another, so how well a
+spritemap compresses depends on which sprites share scanlines. Sprites of the
+same size can trade places in any packing without changing its size, so
+they are swapped around while that makes the image compress better.
+
+1. Draw the sprites on a canvas of rows, as they are written to the image
+2. For pairs of same-size sprites, taken in turns from each size and nearest
+   in placement order first, swap them on the canvas and compress
+   the rows either of them covers, before and after, with zlib as the PNG
+   writer does; keep the swap if it made those rows smaller
+3. Compress the whole canvas to make sure the result is smaller overall
+
+Only the rows a swap touches are compressed for it, which keeps trials cheap
+at the cost of missing how they compress along with the rows around them.
+"""
+
+import zlib
+from array import array
+from itertools import islice
+
+from . import PlacedBoxes
+from .sprites import peek_pixels
+
+def _row_bytes(row, bc):
+    if not (isinstance(row, array) and row.typecode == bc):
+        row = array(bc, row)
+    return row.tostring()
+
+class _Canvas(object):
+    """The rows of the image that sprite nodes placed as in *placements*
+    make, as byte strings in bytearrays.
+    """
+
+    def __init__(self, placements, size):
+        (width, height) = size
+        bd = max(sn.im.bitdepth for (pos, sn) in placements)
+        self.pixel_bytes = 4 * (1 + (bd > 8))
+        self.rows = [bytearray(width * self.pixel_bytes)
+                     for y in xrange(height)]
+        self.sprite_rows = {}
+        for (pos, sn) in placements:
+            self.draw(pos, sn)
+
+    def _rows_of(self, sn):
+        if id(sn) not in self.sprite_rows:
+            bc = "BH"[sn.im.bitdepth > 8]
+            self.sprite_rows[id(sn)] = [bytearray(_row_bytes(r, bc))
+                                        for r in peek_pixels(sn)]
+        return self.sprite_rows[id(sn)]
+
+    def draw(self, pos, sn):
+        (x, y) = pos
+        x1 = x * self.pixel_bytes
+        for (dy, row) in enumerate(self._rows_of(sn)):
+            self.rows[y + dy][x1:x1 + len(row)] = row
+
+    def compressed_size(self, ys=None):
+        """Size of rows *ys* (all by default) compressed as by the writer,
+        with the filter type byte in front of each row.
+        """
+        if ys is None:
+            ys = xrange(len(self.rows))
+        data = "".join("\0" + str(self.rows[y]) for y in ys)
+        return len(zlib.compress(data))
+
+def _swap_pairs(slots):
+    """Yield each pair of *slots* once, those nearest in the list first, so
+    early pairs spread over all slots rather than pairing one with the rest.
+    """
+    for d in xrange(1, len(slots)):
+        for k in xrange(len(slots) - d):
+            yield (slots[k], slots[k + d])
+
+def _round_robin(iterables):
+    """Yield an item of each of *iterables* in turn until all run out."""
+    iters = [iter(it) for it in iterables]
+    while iters:
+        for it in list(iters):
+            try:
+                yield next(it)
+            except StopIteration:
+                iters.remove(it)
+
+def arrange_for_compression(placements, size, max_trials=1000):
+    """Swap sprite nodes of the same size in *placements* to make the image
+    they stitch into, of *size*, compress better.
+
+    At most *max_trials* swaps are tried. Returns the placed boxes, or None
+    if no swaps made the image smaller.
+    """
+    plcs = list(placements)
+    canvas = _Canvas(plcs, size)
+
+    groups = {}
+    for (i, (pos, sn)) in enumerate(plcs):
+        key = (sn.width, sn.height, sn.pad_x, sn.pad_y)
+        groups.setdefault(key, []).append(i)
+    pairs = _round_robin(_swap_pairs(slots)
+                         for (key, slots) in sorted(groups.iteritems()))
+
+    slot_box = range(len(plcs))
+    def swap(s, t):
+        (slot_box[s], slot_box[t]) = (slot_box[t], slot_box[s])
+        canvas.draw(plcs[s][0], plcs[slot_box[s]][1])
+        canvas.draw(plcs[t][0], plcs[slot_box[t]][1])
+
+    before = canvas.compressed_size()
+    swapped = False
+    for (s, t) in islice(pairs, max_trials):
+        ((xs, ys), sn) = plcs[s]
+        (xt, yt) = plcs[t][0]
+        rows = sorted(set(range(ys, ys + sn.height)) |
+                      set(range(yt, yt + sn.height)))
+        cost = canvas.compressed_size(rows)
+        swap(s, t)
+        if canvas.compressed_size(rows) < cost:
+            swapped = True
+        else:
+            swap(s, t)
+
+    if swapped and canvas.compressed_size() < before:
+        return PlacedBoxes([(plcs[s][0], plcs[box][1])
+                            for (s, box) in enumerate(slot_box)])
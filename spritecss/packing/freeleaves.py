@@ -0,0 +1,104 @@
+"""Index of free space in a packing tree
+
+Inserting a box into a `BoxNode` tree puts it in the first free leaf, in
+depth-first order, that is large enough. Walking the tree for it means
+visiting every node before that leaf, and each one that can't take the box
+raises `NoRoom`.
+
+The free leaves are instead kept in a list in depth-first order, which is
+cheap to maintain: dividing a leaf replaces it with its new free leaves, in
+the same place. The list is cut into blocks that know the largest width and
+height of any leaf in them, so a lookup skips every block that can't hold the
+box and only scans the leaves of the rest.
+"""
+
+class _Block(object):
+    __slots__ = ("nodes", "widths", "heights", "max_width", "max_height")
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.widths = [n.x2 - n.x1 for n in nodes]
+        self.heights = [n.y2 - n.y1 for n in nodes]
+        self.update()
+
+    def update(self):
+        self.max_width = max(self.widths) if self.widths else 0
+        self.max_height = max(self.heights) if self.heights else 0
+
+    def splice(self, idx, count, nodes):
+        end = idx + count
+        self.nodes[idx:end] = nodes
+        self.widths[idx:end] = [n.x2 - n.x1 for n in nodes]
+        self.heights[idx:end] = [n.y2 - n.y1 for n in nodes]
+        self.update()
+
+class FreeLeaves(object):
+    """The free leaves of a packing tree, in depth-first order."""
+
+    block_size = 48
+
+    def __init__(self, leaves):
+        leaves = list(leaves)
+        bs = self.block_size
+        self.blocks = [_Block(leaves[i:i + bs])
+                       for i in xrange(0, len(leaves), bs)] or [_Block([])]
+
+    def __len__(self):
+        return sum(len(b.nodes) for b in self.blocks)
+
+    def __iter__(self):
+        for block in self.blocks:
+            for node in block.nodes:
+                yield node
+
+    def find(self, width, height):
+        """Find the first leaf that is at least *width* by *height*.
+
+        Returns its position and the leaf, or None if no leaf is large enough.
+        """
+        pos = 0
+        for block in self.blocks:
+            if block.max_width >= width and block.max_height >= height:
+                hs = block.heights
+                for (i, w) in enumerate(block.widths):
+                    if w >= width and hs[i] >= height:
+                        return (pos + i, block.nodes[i])
+            pos += len(block.nodes)
+
+    def replace(self, pos, count, nodes):
+        """Replace the *count* leaves from position *pos* with *nodes*."""
+        blocks = self.blocks
+        bi = 0
+        while bi < len(blocks) - 1 and pos >= len(blocks[bi].nodes):
+            pos -= len(blocks[bi].nodes)
+            bi += 1
+        # Leaves to remove may run over into the following blocks.
+        first = blocks[bi]
+        here = min(count, len(first.nodes) - pos)
+        first.splice(pos, here, nodes)
+        count -= here
+        nb = bi + 1
+        while count:
+            block = blocks[nb]
+            here = min(count, len(block.nodes))
+            block.splice(0, here, [])
+            count -= here
+            nb += 1
+        self._rebalance(max(0, bi - 1), nb + 1)
+
+    def _rebalance(self, start, end):
+        """Split large and merge small blocks in blocks[start:end]."""
+        bs = self.block_size
+        new = []
+        for block in self.blocks[start:end]:
+            if len(block.nodes) > 2 * bs:
+                nodes = block.nodes
+                new.extend(_Block(nodes[i:i + bs])
+                           for i in xrange(0, len(nodes), bs))
+            elif new and len(new[-1].nodes) + len(block.nodes) <= bs:
+                new[-1] = _Block(new[-1].nodes + block.nodes)
+            elif block.nodes:
+                new.append(block)
+        self.blocks[start:end] = new
+        if not self.blocks:
+            self.blocks.append(_Block([]))
@@ -0,0 +1,100 @@
+"""MaxRects box packing
+
+Packs boxes in one deterministic pass, without annealing. The packer keeps a
+list of maximal free rectangles: every empty area of the container that
+cannot grow in any direction without overlapping a placed box. These overlap
+each other, which is what lets a box use any free space it fits in.
+
+1. Sort the boxes by their longest side, longest first
+2. Put each box in the free rectangle that leaves the least over on its
+   shortest side (the best short side fit), at the top left corner
+3. Split every free rectangle the box overlaps into the maximal rectangles
+   around it, and drop those that are contained in another
+
+The container is a strip about as wide as a square holding the summed area of
+all boxes would be, and tall enough for any packing.
+"""
+
+import math
+
+from . import BasePackedBoxes, register_packer
+
+def _contains(a, b):
+    """Check if rect tuple *a* contains rect tuple *b*."""
+    return a[0] <= b[0] and a[1] <= b[1] and a[2] >= b[2] and a[3] >= b[3]
+
+def _split(free, used):
+    """Split *free* around the overlapping *used*, yielding the maximal
+    rectangles left of, right of, above and below it.
+    """
+    (fx1, fy1, fx2, fy2) = free
+    (ux1, uy1, ux2, uy2) = used
+    if ux1 > fx1:
+        yield (fx1, fy1, ux1, fy2)
+    if ux2 < fx2:
+        yield (ux2, fy1, fx2, fy2)
+    if uy1 > fy1:
+        yield (fx1, fy1, fx2, uy1)
+    if uy2 < fy2:
+        yield (fx1, uy2, fx2, fy2)
+
+class MaxRects(object):
+    """The free rectangles of a *width* by *height* container."""
+
+    def __init__(self, width, height):
+        self.free = [(0, 0, width, height)]
+
+    def find(self, w, h):
+        """Find the best short side fit for a *w* by *h* box.
+
+        Returns the position, or None if there is no room.
+        """
+        best = best_pos = None
+        for (x1, y1, x2, y2) in self.free:
+            (left_w, left_h) = (x2 - x1 - w, y2 - y1 - h)
+            if left_w >= 0 and left_h >= 0:
+                fit = (min(left_w, left_h), max(left_w, left_h), y1, x1)
+                if best is None or fit < best:
+                    (best, best_pos) = (fit, (x1, y1))
+        return best_pos
+
+    def place(self, rect):
+        """Mark rect tuple *rect* as used."""
+        (ux1, uy1, ux2, uy2) = rect
+        kept, split = [], []
+        for f in self.free:
+            if f[0] >= ux2 or f[2] <= ux1 or f[1] >= uy2 or f[3] <= uy1:
+                kept.append(f)
+            else:
+                split.extend(_split(f, rect))
+        # Only the new rectangles can be redundant: any kept rectangle inside
+        # a new one was already inside the rectangle that got split.
+        for (i, r) in enumerate(split):
+            if any(_contains(f, r) for f in kept):
+                continue
+            if any(_contains(f, r) and (f != r or j < i)
+                   for (j, f) in enumerate(split) if j != i):
+                continue
+            kept.append(r)
+        self.free = kept
+
+@register_packer("maxrects")
+class MaxRectsPackedBoxes(BasePackedBoxes):
+    def _pack(self, boxes):
+        boxes.sort(key=lambda b: (max(b.outer_size), min(b.outer_size)),
+                   reverse=True)
+        width = max(max(b.outer_width for b in boxes),
+                    int(math.ceil(math.sqrt(self.optimal_area))))
+        height = sum(b.outer_height for b in boxes)
+        free = MaxRects(width, height)
+        plcs = []
+        w = h = 0
+        for box in boxes:
+            (ow, oh) = box.outer_size
+            (x, y) = free.find(ow, oh)
+            free.place((x, y, x + ow, y + oh))
+            plcs.append(((x, y), box))
+            w = max(w, x + ow)
+            h = max(h, y + oh)
+        self.placements = plcs
+        self.size = (w, h)
@@ -0,0 +1,97 @@
+"""Spreading boxes over several packings of limited size
+
+A packing that grows wider, taller or larger in area than allowed is split
+into pages. Each page is filled by placing the largest remaining boxes that
+fit into a container of the largest allowed size with MaxRects, and the boxes
+that made it onto the page are then packed again by the packer in use. When
+that packing breaks the limits, the MaxRects placement is used as it is.
+"""
+
+import math
+
+from . import PlacedBoxes
+from .maxrects import MaxRects
+
+class PageLimits(object):
+    """Limits on the width, height and area of a packing; None for no limit."""
+
+    def __init__(self, max_width=None, max_height=None, max_pixels=None):
+        self.max_width = max_width
+        self.max_height = max_height
+        self.max_pixels = max_pixels
+
+    @classmethod
+    def from_conf(cls, conf):
+        return cls(conf.max_width, conf.max_height, conf.max_pixels)
+
+    def fits(self, size):
+        (w, h) = size
+        return ((self.max_width is None or w <= self.max_width) and
+                (self.max_height is None or h <= self.max_height) and
+                (self.max_pixels is None or w * h <= self.max_pixels))
+
+    def page_size(self, boxes):
+        """The largest container for *boxes* the limits allow.
+
+        An area limit alone gives a square; otherwise the unlimited side is
+        given whatever the area limit leaves, or room for all *boxes*.
+        """
+        (w, h, px) = (self.max_width, self.max_height, self.max_pixels)
+        if px is not None:
+            if w is None and h is None:
+                w = h = int(math.sqrt(px))
+            elif w is None:
+                w = px // h
+            elif h is None:
+                h = px // w
+            else:
+                h = min(h, px // w)
+        if w is None:
+            w = sum(b.outer_width for b in boxes)
+        if h is None:
+            h = sum(b.outer_height for b in boxes)
+        return (w, h)
+
+def fill_page(boxes, size):
+    """Place as many of *boxes*, largest first, as fit a container of *size*.
+
+    Returns the placements made and the boxes left over.
+    """
+    free = MaxRects(*size)
+    (placed, left) = ([], [])
+    for box in sorted(boxes, key=lambda b: b.outer_area, reverse=True):
+        (ow, oh) = box.outer_size
+        pos = free.find(ow, oh)
+        if pos is None:
+            left.append(box)
+        else:
+            free.place((pos[0], pos[1], pos[0] + ow, pos[1] + oh))
+            placed.append((pos, box))
+    return (placed, left)
+
+def pack_pages(boxes, pack, limits):
+    """Pack *boxes* into as few pages as *limits* allow.
+
+    *pack* is called with a list of boxes and returns packed boxes. Returns a
+    list of packed boxes, one per page.
+    """
+    boxes = list(boxes)
+    packed = pack(boxes)
+    if limits.fits(packed.size):
+        return [packed]
+
+    # Pages are packed with their boxes in the order given, which may well be
+    # an order worth keeping.
+    rank = dict((id(box), i) for (i, box) in enumerate(boxes))
+    pages = []
+    while boxes:
+        (placed, boxes) = fill_page(boxes, limits.page_size(boxes))
+        if not placed:
+            raise ValueError("%s is larger than the spritemap size limits"
+                             % (boxes[0],))
+        packed = pack(sorted((box for (pos, box) in placed),
+                             key=lambda box: rank[id(box)]))
+        if not limits.fits(packed.size):
+            packed = PlacedBoxes(placed)
+        pages.append(packed)
+    return pages
@@ -1,6 +1,8 @@
+import hashlib
+from os import path
 from contextlib import contextmanager
 
-from ..image import Image
+from ..image import Image, DeferredImage
 from . import Rect
 
 class SpriteNode(Rect):
@@ -36,11 +38,155 @@ class SpriteNode(Rect):
             fname = fo.name
         return cls.from_image(Image.load(fo), fname=fname, pad=pad)
 
+    @classmethod
+    def probe_file(cls, fname, pad=(0, 0), **kwds):
+        """Make a sprite node of the PNG file *fname* by reading its size
+        only; its pixels are decoded when they are used.
+        """
+        im = DeferredImage.probe(str(fname))
+        return cls.from_image(im, fname=fname, pad=pad)
+
 @contextmanager
 def open_sprites(fnames, **kwds):
-    fs = [(fn, open(str(fn), "rb")) for fn in fnames]
+    """Probe the sprites *fnames* for their sizes.
+
+    No file is kept open, so any number of sprites can be opened at once.
+    """
+    sprites = [SpriteNode.probe_file(fn, **kwds) for fn in fnames]
     try:
-        yield [SpriteNode.load_file(fo, fname=fn, **kwds) for (fn, fo) in fs]
+        yield sprites
     finally:
-        for fn, fo in fs:
-            fo.close()
+        for sn in sprites:
+            sn.close()
+
+def peek_pixels(sn):
+    """Read the pixel rows of sprite node *sn*, leaving them to be read again.
+
+    A deferred image decodes afresh on each use, so its rows stream without
+    being kept. Other images' rows may be readable only once, so they are
+    kept there as a list.
+    """
+    if isinstance(sn.im, DeferredImage):
+        return sn.im.pixels
+    rows = sn.im.pixels = list(sn.im.pixels)
+    return rows
+
+def _pixels_digest(sn):
+    """Hash the decoded pixels of sprite node *sn*."""
+    rows = peek_pixels(sn)
+    h = hashlib.sha1("%dx%d@%d" % (sn.width, sn.height, sn.im.bitdepth))
+    for row in rows:
+        h.update(row.tostring())
+    return h.digest()
+
+def dedup_sprites(sprites):
+    """Weed out sprites whose pixels are identical to an earlier sprite's.
+
+    Returns the unique sprites and a list of (duplicate, original).
+    """
+    (unique, aliases, seen) = ([], [], {})
+    for sn in sprites:
+        digest = _pixels_digest(sn)
+        if digest in seen:
+            aliases.append((sn, seen[digest]))
+        else:
+            seen[digest] = sn
+            unique.append(sn)
+    return (unique, aliases)
+
+def alias_placements(placements, aliases):
+    """Place the duplicates in *aliases* where their original is placed."""
+    positions = dict((id(sn), pos) for (pos, sn) in placements)
+    return [(positions[id(orig)], sn) for (sn, orig) in aliases
+            if id(orig) in positions]
+
+def _sprite_name(sn):
+    return path.normpath(str(sn.fname))
+
+def order_fname(smap):
+    """The file that keeps the packing order of spritemap *smap*."""
+    return path.splitext(smap.fname)[0] + ".order"
+
+def load_sprite_order(fname):
+    """Read the sprite file names listed in *fname*, or None if missing."""
+    if not path.exists(fname):
+        return
+    base = path.dirname(fname)
+    with open(fname, "rb") as fp:
+        return [path.normpath(path.join(base, ln.rstrip("\n")))
+                for ln in fp if ln.strip()]
+
+def save_sprite_order(fname, sprites):
+    """Write the file names of *sprites* to *fname*, one per line."""
+    base = path.dirname(fname)
+    with open(fname, "wb") as fp:
+        for sn in sprites:
+            fp.write(path.relpath(str(sn.fname), base or ".") + "\n")
+
+def order_sprites(sprites, names):
+    """Order *sprites* after their file names in the earlier order *names*.
+
+    Sprites in both keep the relative order of *names*. The others are taken
+    largest first and each put in front of the first sprite smaller than it,
+    as sorting by area would. Returns the ordered sprites and the number of
+    them that were in *names*.
+    """
+    rank = dict((name, i) for (i, name) in enumerate(names))
+    key = _sprite_name
+    rv = [sn for sn in sprites if key(sn) in rank]
+    rv.sort(key=lambda sn: rank[key(sn)])
+    kept = len(rv)
+    new = [sn for sn in sprites if key(sn) not in rank]
+    new.sort(key=lambda sn: sn.area, reverse=True)
+    for sn in new:
+        idx = next((i for (i, o) in enumerate(rv) if o.area < sn.area),
+                   len(rv))
+        rv.insert(idx, sn)
+    return (rv, kept)
+
+def layout_fname(smap):
+    """The file that keeps the placements of spritemap *smap*."""
+    return path.splitext(smap.fname)[0] + ".layout"
+
+def load_sprite_layout(fname):
+    """Read the placements written by `save_sprite_layout` to *fname*.
+
+    Returns a dict of sprite file name to position and outer size, or None if
+    there is no such file.
+    """
+    if not path.exists(fname):
+        return
+    base = path.dirname(fname)
+    layout = {}
+    with open(fname, "rb") as fp:
+        for ln in fp:
+            if not ln.strip():
+                continue
+            (x, y, w, h, name) = ln.rstrip("\n").split(" ", 4)
+            name = path.normpath(path.join(base, name))
+            layout[name] = (int(x), int(y), int(w), int(h))
+    return layout
+
+def save_sprite_layout(fname, placements):
+    """Write the position and outer size of each sprite in *placements*."""
+    base = path.dirname(fname)
+    with open(fname, "wb") as fp:
+        for ((x, y), sn) in placements:
+            name = path.relpath(str(sn.fname), base or ".")
+            (w, h) = sn.outer_size
+            fp.write("%d %d %d %d %s\n" % (x, y, w, h, name))
+
+def pin_sprites(sprites, layout):
+    """Split *sprites* into those placed by *layout* and the others.
+
+    Sprites whose size changed since are not placed by it. Returns a list of
+    (position, sprite) and a list of the other sprites.
+    """
+    (pinned, new) = ([], [])
+    for sn in sprites:
+        plc = layout.get(_sprite_name(sn))
+        if plc is not None and plc[2:] == sn.outer_size:
+            pinned.append((plc[:2], sn))
+        else:
+            new.append(sn)
+    return (pinned, new)
@@ -0,0 +1,53 @@
+"""Adding boxes to an earlier packing without moving the others
+
+Repacking moves boxes around whenever one is added or removed. Keeping every
+box of an earlier packing where it was instead, and fitting the new ones
+around them, keeps the positions of unchanged boxes stable between builds.
+
+1. Mark the pinned boxes as used in a container the size of their packing
+2. Put each new box, largest first, in the free space of that container with
+   MaxRects, leaving the holes of removed boxes to be filled
+3. Put the boxes that found no room in a strip appended below the packing
+
+As this wastes ever more space, the caller is expected to repack once the
+unused amount of the packing grows too large.
+"""
+
+from . import PlacedBoxes
+from .maxrects import MaxRects
+
+def place_pinned(pinned, boxes):
+    """Place *boxes* around the (position, box) pairs of *pinned*.
+
+    Returns the placed boxes, pinned ones first.
+    """
+    width = max([x + b.outer_width for ((x, y), b) in pinned] or [0])
+    height = max([y + b.outer_height for ((x, y), b) in pinned] or [0])
+    free = MaxRects(width, height)
+    for ((x, y), box) in pinned:
+        free.place((x, y, x + box.outer_width, y + box.outer_height))
+
+    boxes = sorted(boxes, key=lambda b: (max(b.outer_size), min(b.outer_size)),
+                   reverse=True)
+    plcs = list(pinned)
+    left = []
+    for box in boxes:
+        (ow, oh) = box.outer_size
+        pos = free.find(ow, oh)
+        if pos is None:
+            left.append(box)
+            continue
+        (x, y) = pos
+        free.place((x, y, x + ow, y + oh))
+        plcs.append((pos, box))
+
+    if left:
+        strip = MaxRects(max([width] + [b.outer_width for b in left]),
+                         sum(b.outer_height for b in left))
+        for box in left:
+            (ow, oh) = box.outer_size
+            (x, y) = strip.find(ow, oh)
+            strip.place((x, y, x + ow, y + oh))
+            plcs.append(((x, height + y), box))
+
+    return PlacedBoxes(plcs)
@@ -2,20 +2,31 @@
 
 import logging
 
-from . import SpriteRef
+from . import SpriteRef, SpriteMapPage
 from .css import split_declaration
 from .finder import NoSpriteFound, get_background_url
 
 logger = logging.getLogger(__name__)
 
 def _build_pos_map(smap, placements):
-    """Build a dict of sprite ref => pos."""
-    return dict((n.fname, p) for (p, n) in placements)
+    """Build a dict of sprite ref => (spritemap image filename, pos)."""
+    return dict((n.fname, (smap.fname, p)) for (p, n) in placements)
 
 class SpriteReplacer(object):
+    """Replaces sprite references with positions in spritemap images.
+
+    *spritemaps* is a sequence of (spritemap, placements). A spritemap that
+    is split over several images is given as one `SpriteMapPage` per image.
+    """
+
     def __init__(self, spritemaps):
-        self._smaps = dict((sm.fname, _build_pos_map(sm, plcs))
-                           for (sm, plcs) in spritemaps)
+        self._smaps = {}
+        for (sm, plcs) in spritemaps:
+            if isinstance(sm, SpriteMapPage):
+                key = sm.spritemap.fname
+            else:
+                key = sm.fname
+            self._smaps.setdefault(key, {}).update(_build_pos_map(sm, plcs))
 
     def __call__(self, css):
         with css.open_parser() as p:
@@ -42,8 +53,7 @@ class SpriteReplacer(object):
         return ev
 
     def _replace_val(self, css, ev, sref):
-        sm_fn = css.mapper(sref)
-        pos = self._smaps[sm_fn][sref]
+        (sm_fn, pos) = self._smaps[css.mapper(sref)][sref]
         sm_url = css.conf.get_spritemap_url(sm_fn)
         logger.debug("replace bg %s at L%d with spritemap %s at %s",
                      sref, ev.state.token.line_no, sm_url, pos)
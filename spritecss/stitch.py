@@ -56,17 +56,62 @@ class StitchedSpriteNodes(object):
         else:
             return self.iter_empty_rows(n)
 
+class StitchedPlacements(object):
+    """An iterable that yields the image data rows of sprite nodes placed at
+    given positions.
+
+    Rows are made by sweeping down the image, keeping the sprites that cover
+    the current row as active. Each row of an active sprite is copied into
+    one row buffer, which is cleared only where a sprite ends, so a row costs
+    time by the number of sprites on it. The same buffer is yielded for every
+    row, and so must be copied to be kept.
+    """
+
+    def __init__(self, placements, size, bitdepth=8, planes=3):
+        bc = "BH"[bitdepth > 8]
+        self.placements = sorted(placements, key=lambda (pos, n): pos[1])
+        self.size = size
+        self.bitdepth = bitdepth
+        self.planes = planes
+        self._mkarray = lambda *a: array(bc, *a)
+
+    def __iter__(self):
+        (width, height) = self.size
+        planes = self.planes
+        row = self._mkarray([0]) * (width * planes)
+        blank = self._mkarray([0]) * (width * planes)
+        plcs = iter(self.placements)
+        pending = next(plcs, None)
+        #: list of (start, end, last row + 1, row iterator) for each sprite
+        #: covering the current row
+        active = []
+        for y in xrange(height):
+            if any(a[2] == y for a in active):
+                for (start, end, y_end, rows) in active:
+                    if y_end == y:
+                        row[start:end] = blank[start:end]
+                active = [a for a in active if a[2] > y]
+            while pending is not None and pending[0][1] == y:
+                ((x, y1), n) = pending
+                active.append((x * planes, (x + n.width) * planes,
+                               y1 + n.height, iter(n.im.pixels)))
+                pending = next(plcs, None)
+            for (start, end, y_end, rows) in active:
+                row[start:end] = next(rows)
+            yield row
+
 def stitch(packed, mode="RGBA", reusable=False):
     assert mode == "RGBA"  # TODO Support other modes than RGBA
-    root = packed.tree
     bd = max(sn.im.bitdepth for (pos, sn) in packed.placements)
     meta = {"bitdepth": bd, "alpha": True}
     planes = 3 + int(meta["alpha"])
 
-    pixels = StitchedSpriteNodes(root, bitdepth=bd, planes=planes)
+    size = packed.size
+    pixels = StitchedPlacements(packed.placements, size,
+                                bitdepth=bd, planes=planes)
     if reusable:
-        pixels = list(pixels)
-    return Image(root.width, root.height, pixels, meta)
+        pixels = [row[:] for row in pixels]
+    return Image(size[0], size[1], pixels, meta)
 
 def _pack_and_stitch(smap_fn, sprites, conf=None):
     import sys
@@ -0,0 +1,52 @@
+import shutil
+import tempfile
+
+from nose.tools import eq_, with_setup
+from spritecss.packing.maxrects import MaxRectsPackedBoxes
+from spritecss.packing.cache import PackingCache
+from tests.test_packing import random_boxes, assert_disjoint
+
+cache_dir = None
+
+def make_cache_dir():
+    global cache_dir
+    cache_dir = tempfile.mkdtemp()
+
+def remove_cache_dir():
+    shutil.rmtree(cache_dir)
+
+@with_setup(make_cache_dir, remove_cache_dir)
+def test_cache_hit():
+    calls = []
+    def pack(boxes):
+        calls.append(boxes)
+        return MaxRectsPackedBoxes(boxes)
+    cache = PackingCache(cache_dir)
+    cached_pack = cache.wrap(pack, ["maxrects", []])
+
+    boxes = random_boxes(30)
+    packed = cached_pack(boxes)
+    eq_(len(calls), 1)
+
+    # Same geometry, different boxes and order: served from the cache.
+    others = random_boxes(30)
+    others.reverse()
+    hit = cached_pack(others)
+    eq_(len(calls), 1)
+    eq_(hit.size, packed.size)
+    assert hit.tree is None
+    assert_disjoint(hit.placements)
+    eq_(sorted(map(id, [b for (p, b) in hit.placements])),
+        sorted(map(id, others)))
+
+    # Other settings miss.
+    cache.wrap(pack, ["maxrects", [1]])(others)
+    eq_(len(calls), 2)
+
+@with_setup(make_cache_dir, remove_cache_dir)
+def test_cache_corrupt():
+    cache = PackingCache(cache_dir)
+    boxes = random_boxes(10)
+    with open(cache._fname(boxes, []), "wb") as fp:
+        fp.write("{not json")
+    eq_(cache.get(boxes, []), None)
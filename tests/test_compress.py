@@ -0,0 +1,49 @@
+import os
+import random
+import shutil
+import tempfile
+from nose.tools import eq_
+from spritecss.packing.compress import (arrange_for_compression, _Canvas,
+                                        _swap_pairs, _round_robin)
+from spritecss import png
+from spritecss.packing.sprites import open_sprites
+from tests.test_sprites import make_sprite
+
+def test_arrange_for_compression():
+    rnd = random.Random(4)
+    colors = [[rnd.randrange(256) for i in xrange(4)] for j in xrange(3)]
+    plcs = [((8 * (i % 6), 8 * (i // 6)),
+             make_sprite("%d.png" % i, 8, 8, rnd.choice(colors)))
+            for i in xrange(24)]
+    size = (48, 32)
+    arranged = arrange_for_compression(plcs, size)
+    assert arranged is not None
+    eq_(sorted(pos for (pos, sn) in arranged.placements),
+        sorted(pos for (pos, sn) in plcs))
+    eq_(sorted(id(sn) for (pos, sn) in arranged.placements),
+        sorted(id(sn) for (pos, sn) in plcs))
+    assert (_Canvas(arranged.placements, size).compressed_size() <
+            _Canvas(plcs, size).compressed_size())
+
+def test_swap_pairs():
+    eq_(list(_swap_pairs("abc")), [("a", "b"), ("b", "c"), ("a", "c")])
+    eq_(list(_round_robin([_swap_pairs("abc"), _swap_pairs("xy")])),
+        [("a", "b"), ("x", "y"), ("b", "c"), ("a", "c")])
+
+def test_arrange_deferred():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fnames = []
+        for (i, color) in enumerate([[255, 0, 0, 255], [0, 0, 255, 255]] * 2):
+            fname = os.path.join(tmpdir, "%d.png" % i)
+            with open(fname, "wb") as fp:
+                png.Writer(4, 4, alpha=True).write(fp, [color * 4] * 4)
+            fnames.append(fname)
+        with open_sprites(fnames) as sprites:
+            plcs = [((4 * i, 0), sn) for (i, sn) in enumerate(sprites)]
+            arrange_for_compression(plcs, (16, 4))
+            # the pixels are decoded again when stitched, not kept
+            for sn in sprites:
+                eq_(sn.im._pixels, None)
+    finally:
+        shutil.rmtree(tmpdir)
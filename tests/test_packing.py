@@ -0,0 +1,217 @@
+import random
+from nose.tools import eq_
+from spritecss.packing import Box, PackingAnnealer
+
+def make_boxes(sizes, pad=(1, 1)):
+    return [Box(w, h, pad=pad) for (w, h) in sizes]
+
+def random_boxes(n, seed=0):
+    rnd = random.Random(seed)
+    return make_boxes([(rnd.randint(1, 40), rnd.randint(1, 40))
+                       for i in xrange(n)])
+
+def test_incremental_energy():
+    boxes = random_boxes(40)
+    rnd = random.Random(1)
+    p = PackingAnnealer(boxes)
+    state = range(len(boxes))
+    for i in xrange(100):
+        p.move(state)
+        if i % 7 == 0:
+            rnd.shuffle(state)
+        fresh = PackingAnnealer(boxes)
+        eq_(p.energy(state), fresh.energy(state))
+        eq_(p.placements, fresh.placements)
+
+def test_move_undo():
+    p = PackingAnnealer(random_boxes(10))
+    state = range(10)
+    kinds = set()
+    for i in xrange(200):
+        change = p.move(state)
+        kinds.add(change[0])
+        assert state != range(10)
+        p.undo(state, change)
+        eq_(state, range(10))
+    eq_(kinds, set(["swap", "shift", "reverse"]))
+
+def test_swap_size_classes():
+    boxes = make_boxes([(16, 16)] * 8 + [(24, 24)] * 2)
+    p = PackingAnnealer(boxes)
+    eq_(p.size_classes, 2)
+    state = range(10)
+    for i in xrange(50):
+        (kind, a, b) = p._move_swap(state)
+        assert (state[a] < 8) != (state[b] < 8)
+        p.undo(state, (kind, a, b))
+
+def test_anneal_parallel():
+    from spritecss.packing import anneal_parallel
+    boxes = random_boxes(12)
+    p = PackingAnnealer(boxes)
+    schedule = dict(Tmax=1000, Tmin=10, steps=50)
+    (state, steps_used) = anneal_parallel(boxes, 2, schedule)
+    eq_(steps_used, 50)
+    eq_(sorted(state), range(12))
+    (plcs, size) = p.pack(state)
+    eq_(len(plcs), 12)
+
+def test_seed():
+    from spritecss.packing import PackedBoxes
+    boxes = random_boxes(30)
+    positions = lambda packed: [(pos, id(box))
+                                for (pos, box) in packed.placements]
+    for jobs in (1, 2):
+        pack = lambda: PackedBoxes(list(boxes), anneal_steps=300, jobs=jobs,
+                                   seed=7)
+        eq_(positions(pack()), positions(pack()))
+
+def assert_disjoint(placements):
+    rects = [(x, y, x + b.outer_width, y + b.outer_height)
+             for ((x, y), b) in placements]
+    for (i, a) in enumerate(rects):
+        for b in rects[i + 1:]:
+            assert (a[2] <= b[0] or b[2] <= a[0] or
+                    a[3] <= b[1] or b[3] <= a[1]), (a, b)
+
+def test_maxrects():
+    from spritecss.packing.maxrects import MaxRectsPackedBoxes
+    boxes = random_boxes(60)
+    packed = MaxRectsPackedBoxes(boxes)
+    eq_(len(packed.placements), 60)
+    eq_(packed.tree, None)
+    assert_disjoint(packed.placements)
+    assert packed.area >= packed.optimal_area
+
+def test_packer_from_conf():
+    from spritecss.config import CSSConfig
+    from spritecss.packing import packer_from_conf, PackedBoxes
+    from spritecss.packing.maxrects import MaxRectsPackedBoxes
+    eq_(packer_from_conf(CSSConfig()), PackedBoxes)
+    conf = CSSConfig(base={"packer": "maxrects"})
+    eq_(packer_from_conf(conf), MaxRectsPackedBoxes)
+
+def test_anneal_lower_bound():
+    # four equal boxes can always be packed without waste
+    boxes = make_boxes([(9, 9)] * 4)
+    p = PackingAnnealer(boxes)
+    eq_(p.lower_bound, 400)
+    p.anneal(1000, 10, 100, Emin=p.lower_bound)
+    eq_(p.steps_used, 0)
+
+def test_anneal_patience():
+    p = PackingAnnealer(random_boxes(10))
+    p.anneal(1, 0.5, 5000, patience=50)
+    assert p.steps_used < 5000
+
+def test_anneal_deadline():
+    import time
+    p = PackingAnnealer(random_boxes(10))
+    p.anneal(1000, 10, 10 ** 6, deadline=time.time() + 0.1)
+    assert p.steps_used < 10 ** 6
+
+def test_free_leaves_index():
+    from spritecss.packing import BoxNode
+    boxes = random_boxes(150)
+    p = PackingAnnealer(boxes)
+    state = range(len(boxes))
+    for i in xrange(30):
+        p.move(state)
+        p.energy(state)
+        eq_(map(id, p.free), map(id, p.tree.iter_free_leaves()))
+    # same placements as inserting by walking the tree
+    tree = BoxNode.from_size(p.max_size)
+    expect = [(tree.insert(boxes[idx]).position, boxes[idx]) for idx in state]
+    eq_(p.placements, expect)
+
+def test_energy_memo():
+    boxes = make_boxes([(16, 16)] * 3 + [(24, 24), (8, 30), (30, 8)])
+    p = PackingAnnealer(boxes, memo_size=2)
+    e = p.energy([0, 1, 2, 3, 4, 5])
+    eq_((p.memo_hits, p.memo_misses), (0, 1))
+    # boxes of the same size swapped: the same sequence of size classes
+    eq_(p.energy([1, 0, 2, 3, 4, 5]), e)
+    eq_((p.memo_hits, p.memo_misses), (1, 1))
+    p.energy([3, 0, 1, 2, 4, 5])
+    p.energy([4, 0, 1, 2, 3, 5])
+    # the least recently used state was forgotten
+    p.energy([0, 1, 2, 3, 4, 5])
+    eq_((p.memo_hits, p.memo_misses), (1, 4))
+    (plcs, size) = p.pack([0, 1, 2, 3, 4, 5])
+    eq_(size[0] * size[1], e)
+
+def test_first_fit_state():
+    boxes = random_boxes(60)
+    p = PackingAnnealer(boxes)
+    (state, e) = p.first_fit_state()
+    eq_(sorted(state), range(60))
+    (plcs, size) = p.pack(state)
+    eq_(size[0] * size[1], e)
+    by_area = sorted(range(60), key=lambda idx: -boxes[idx].outer_area)
+    p.fit_root(by_area)
+    assert e <= p.energy(by_area)
+
+def test_best_state():
+    from itertools import permutations
+    boxes = random_boxes(6, seed=3)
+    p = PackingAnnealer(boxes)
+    (state, e) = p.first_fit_state()
+    (best, best_e) = p.best_state(state, e)
+    eq_(sorted(best), range(6))
+    eq_(best_e, min(p.energy(list(order)) for order in permutations(range(6))))
+    (plcs, size) = p.pack(best)
+    eq_(size[0] * size[1], best_e)
+    # out of time, the state given is kept
+    eq_(p.best_state(state, e, deadline=0), (state, e))
+
+def test_hierarchical():
+    from spritecss.packing import PackedBoxes, cluster_boxes
+    boxes = random_boxes(45)
+    bins = cluster_boxes(boxes, 10)
+    eq_(map(len, bins), [9] * 5)
+    packed = PackedBoxes(boxes, anneal_steps=50, bin_size=10, seed=1)
+    assert packed.tree is None
+    assert_disjoint(packed.placements)
+    eq_(sorted(id(b) for (pos, b) in packed.placements), sorted(map(id, boxes)))
+    (w, h) = packed.size
+    for ((x, y), b) in packed.placements:
+        assert x + b.outer_width <= w and y + b.outer_height <= h
+
+def test_tiebreak():
+    boxes = random_boxes(20)
+    state = range(20)
+    plain = PackingAnnealer(boxes)
+    p = PackingAnnealer(boxes, tiebreak=True)
+    e = p.energy(state)
+    (w, h) = p.size
+    eq_(e, plain.energy(state) + p.square_weight * abs(w - h))
+    eq_(p.pack(state), plain.pack(state))
+
+def test_tiebreak_best_by_area():
+    from spritecss.packing import INFINITY
+    boxes = random_boxes(40)
+    p = PackingAnnealer(boxes, seed=6, tiebreak=True)
+    p.fit_root(range(len(boxes)))
+    areas = []
+    energy = p.energy
+    def spy(state):
+        e = energy(state)
+        if e < INFINITY:
+            (w, h) = p.size
+            areas.append(w * h)
+        return e
+    p.energy = spy
+    (plcs, (w, h)) = p.anneal(Tmax=800000, Tmin=1100, steps=2000)
+    # the least area tried wins, however far from square
+    eq_(w * h, min(areas))
+
+def test_fit_root():
+    from spritecss.packing import INFINITY
+    boxes = random_boxes(50)
+    p = PackingAnnealer(boxes)
+    state = range(len(boxes))
+    (w, h) = p.fit_root(state)
+    assert w * h < p.max_size[0] * p.max_size[1]
+    assert p.energy(state) < INFINITY
+    (plcs, size) = p.pack(state)
+    assert size[0] <= w and size[1] <= h
@@ -0,0 +1,32 @@
+from nose.tools import eq_
+from spritecss import SpriteMap, SpriteMapPage
+from spritecss.packing.maxrects import MaxRectsPackedBoxes
+from spritecss.packing.pages import PageLimits, pack_pages
+from tests.test_packing import random_boxes, assert_disjoint
+
+def test_page_fname():
+    page = SpriteMapPage(SpriteMap("img/icons.png"), 2)
+    eq_(page.fname, "img/icons-2.png")
+
+def test_no_split():
+    boxes = random_boxes(20)
+    pages = pack_pages(boxes, MaxRectsPackedBoxes, PageLimits())
+    eq_(len(pages), 1)
+
+def test_split():
+    boxes = random_boxes(40)
+    limits = PageLimits(max_width=64, max_height=80)
+    pages = pack_pages(boxes, MaxRectsPackedBoxes, limits)
+    assert len(pages) > 1
+    packed_boxes = []
+    for packed in pages:
+        assert limits.fits(packed.size), packed.size
+        assert_disjoint(packed.placements)
+        packed_boxes.extend(box for (pos, box) in packed.placements)
+    eq_(sorted(map(id, packed_boxes)), sorted(map(id, boxes)))
+
+def test_page_size():
+    eq_(PageLimits(max_pixels=100).page_size([]), (10, 10))
+    eq_(PageLimits(max_width=20, max_pixels=100).page_size([]), (20, 5))
+    eq_(PageLimits(max_width=20, max_height=20,
+                   max_pixels=100).page_size([]), (20, 5))
@@ -0,0 +1,96 @@
+from array import array
+from nose.tools import eq_
+from spritecss.image import Image
+import os
+import shutil
+import tempfile
+from spritecss import png
+from spritecss.packing.sprites import (SpriteNode, open_sprites, dedup_sprites,
+                                       alias_placements, order_sprites,
+                                       load_sprite_order, save_sprite_order)
+from spritecss.image import probe_header
+
+def make_sprite(fname, w, h, color):
+    rows = [array("B", color * w) for y in xrange(h)]
+    im = Image(w, h, iter(rows), {"bitdepth": 8, "alpha": True})
+    return SpriteNode.from_image(im, fname=fname)
+
+def test_dedup():
+    a = make_sprite("a.png", 4, 4, [255, 0, 0, 255])
+    b = make_sprite("b.png", 4, 4, [0, 255, 0, 255])
+    a2 = make_sprite("a2.png", 4, 4, [255, 0, 0, 255])
+    wide = make_sprite("wide.png", 8, 2, [255, 0, 0, 255])
+    (unique, aliases) = dedup_sprites([a, b, a2, wide])
+    eq_([sn.fname for sn in unique], ["a.png", "b.png", "wide.png"])
+    eq_(aliases, [(a2, a)])
+    # pixels can still be read after hashing them
+    eq_(len(list(a.im.pixels)), 4)
+    plcs = [((0, 0), a), ((4, 0), b), ((8, 0), wide)]
+    eq_(alias_placements(plcs, aliases), [((0, 0), a2)])
+
+def test_order_sprites():
+    color = [0, 0, 0, 255]
+    a = make_sprite("img/a.png", 4, 4, color)
+    b = make_sprite("img/b.png", 2, 2, color)
+    c = make_sprite("img/c.png", 8, 8, color)
+    new_mid = make_sprite("img/d.png", 3, 3, color)
+    new_small = make_sprite("img/e.png", 1, 1, color)
+    names = ["img/b.png", "img/gone.png", "img/c.png", "img/a.png"]
+    (ordered, kept) = order_sprites([a, new_small, b, c, new_mid], names)
+    eq_(kept, 3)
+    eq_([sn.fname for sn in ordered],
+        ["img/d.png", "img/b.png", "img/c.png", "img/a.png", "img/e.png"])
+
+def test_sprite_order_file():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, "icons.order")
+        eq_(load_sprite_order(fname), None)
+        color = [0, 0, 0, 255]
+        sprites = [make_sprite(os.path.join(tmpdir, "icons", fn), 1, 1, color)
+                   for fn in ("x.png", "y.png")]
+        save_sprite_order(fname, sprites)
+        eq_(load_sprite_order(fname), [sn.fname for sn in sprites])
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_open_sprites_probes():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, "a.png")
+        rows = [[y, 0, 255, 255] * 5 for y in xrange(3)]
+        with open(fname, "wb") as fp:
+            png.Writer(5, 3, alpha=True).write(fp, rows)
+        with open(fname, "rb") as fp:
+            eq_(probe_header(fp), (5, 3, 8))
+        with open_sprites([fname]) as (sn,):
+            eq_((sn.width, sn.height), (5, 3))
+            eq_(sn.im.bitdepth, 8)
+            # each read of the pixels decodes the file afresh
+            eq_([list(row) for row in sn.im.pixels], rows)
+            eq_([list(row) for row in sn.im.pixels], rows)
+            # hashing the pixels doesn't keep them decoded
+            (unique, aliases) = dedup_sprites([sn])
+            eq_(sn.im._pixels, None)
+            eq_([list(row) for row in sn.im.pixels], rows)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_probe_header_bitdepth():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, "a.png")
+        writers = [(png.Writer(2, 2, alpha=True, bitdepth=16), [0] * 8),
+                   (png.Writer(2, 2, greyscale=True, bitdepth=4), [0] * 2),
+                   (png.Writer(2, 2, greyscale=True, bitdepth=5), [0] * 2),
+                   (png.Writer(2, 2, palette=[(0, 0, 0), (255, 0, 0)],
+                               bitdepth=1), [0] * 2)]
+        for (w, row) in writers:
+            with open(fname, "wb") as fp:
+                w.write(fp, [row] * 2)
+            # the bit depth that decoding the pixels gives
+            meta = png.Reader(filename=fname).asRGBA()[3]
+            with open(fname, "rb") as fp:
+                eq_(probe_header(fp), (2, 2, meta["bitdepth"]))
+    finally:
+        shutil.rmtree(tmpdir)
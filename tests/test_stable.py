@@ -0,0 +1,16 @@
+from nose.tools import eq_
+from spritecss.packing.maxrects import MaxRectsPackedBoxes
+from spritecss.packing.stable import place_pinned
+from tests.test_packing import make_boxes, random_boxes, assert_disjoint
+
+def test_place_pinned():
+    packed = MaxRectsPackedBoxes(random_boxes(30))
+    pinned = packed.placements[::2]
+    new = make_boxes([(5, 5), (30, 10), (200, 3)])
+    placed = place_pinned(pinned, new)
+    eq_(placed.placements[:len(pinned)], pinned)
+    assert_disjoint(placed.placements)
+    eq_(len(placed.placements), len(pinned) + len(new))
+    # too wide for the packing: goes below it
+    (pos, box) = [plc for plc in placed.placements if plc[1] is new[2]][0]
+    eq_(pos[1], max(y + b.outer_height for ((x, y), b) in pinned))
@@ -0,0 +1,18 @@
+from nose.tools import eq_
+from spritecss.packing import PackedBoxes
+from spritecss.stitch import StitchedSpriteNodes, stitch
+from tests.test_sprites import make_sprite
+
+def test_stitch_placements():
+    sprites = [make_sprite("%d.png" % i, 3 + i % 4, 2 + i % 5, [i, 0, 0, 255])
+               for i in xrange(20)]
+    for sn in sprites:
+        sn.im.pixels = list(sn.im.pixels)
+    packed = PackedBoxes(sprites, anneal_steps=0)
+    im = stitch(packed, reusable=True)
+    eq_(im.size, packed.size)
+    # the same rows as stitching the tree of the packing
+    eq_(im.pixels, list(StitchedSpriteNodes(packed.tree, planes=4)))
+    for ((x, y), sn) in packed.placements:
+        row = im.pixels[y][x * 4:(x + sn.width) * 4]
+        eq_(list(row), sn.im.pixels[0].tolist())